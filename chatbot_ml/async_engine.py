@@ -0,0 +1,363 @@
+import asyncio
+import threading
+import time
+
+import ollama
+
+from conversation import estimate_tokens, is_follow_up
+from metrics import metrics, span
+
+# -----------------------------
+# MOTOR DE RESPUESTAS ASÍNCRONO
+# -----------------------------
+TIEMPOS_LIMITE = {
+    "db": 2.0,    # segundos para el nivel de base de datos
+    "llm": 60.0,  # segundos para la generación completa de Ollama
+}
+ESPECULACION_RETARDO = 0.05  # segundos de búsqueda antes de lanzar Ollama en paralelo
+ESPECULACION_MAX = 2         # generaciones especulativas simultáneas como máximo
+
+
+class EngineResult:
+    """Respuesta del motor: nivel que contestó, texto y tiempos"""
+
+    def __init__(self, tier, text, first_token_time=None, total_time=0.0, prompt_tokens=None, model=None,
+                 score=None, with_history=False):
+        self.tier = tier
+        self.text = text
+        self.first_token_time = first_token_time
+        self.total_time = total_time
+        self.prompt_tokens = prompt_tokens
+        self.model = model
+        self.score = score  # mejor similitud de la búsqueda en base de datos
+        self.with_history = with_history  # Ollama recibió turnos anteriores de la conversación
+
+    def __repr__(self):
+        return f"EngineResult(tier={self.tier!r}, total_time={self.total_time:.3f})"
+
+
+class ResponseEngine:
+    """Ejecuta los niveles instantáneo → base de datos → Ollama como corrutinas.
+
+    Cada sesión puede tener peticiones en curso que se cancelan con `cancel`;
+    cancelar la tarea cierra el stream HTTP y Ollama deja de generar.
+
+    Con `speculative=True`, si la búsqueda en base de datos no ha terminado tras
+    `speculation_delay` segundos se lanza Ollama en paralelo; si la búsqueda
+    encuentra respuesta, la generación se cancela y se contabiliza como
+    desperdicio. `max_speculative` limita las generaciones especulativas en curso.
+
+    `retrieve(prompt)` retorna (respuesta, score, contexto): sin respuesta, el
+    contexto son filas de `knowledge` parecidas que la misma búsqueda ya
+    encontró y que se pasan a Ollama (las generaciones especulativas arrancan
+    antes de la búsqueda y van sin contexto).
+
+    Con `conversations` (ConversationStore) cada sesión conserva su historial
+    acotado por tokens y recibe ese contexto. El historial solo se envía con los
+    prompts que lo necesitan (`is_follow_up`); los demás se generan sin él y
+    siguen pudiendo servirse desde `generation_cache`.
+
+    Con `router` (ModelRouter) cada generación elige modelo y opciones según el
+    prompt y el mejor score de la búsqueda.
+
+    Con `interaction_log` (InteractionLog) cada respuesta se encola para el
+    registro de tráfico; la escritura ocurre en otro hilo.
+
+    Con `promoter` (AnswerPromoter) las respuestas generadas sin historial se cuentan
+    para promocionar a `knowledge` las que Ollama repite con frecuencia.
+
+    Con `augment(prompt, contexto)` las peticiones sin historial también reciben
+    el contexto en un prompt corto, y cualquier generación
+    con contexto usa `augment_options` (p. ej. menos `num_predict`).
+    """
+
+    def __init__(self, instant, retrieve, model, build_messages, options,
+                 system_prompt="", fallback=None, generation_cache=None,
+                 timeouts=None, client=None, speculative=False,
+                 speculation_delay=ESPECULACION_RETARDO, max_speculative=ESPECULACION_MAX,
+                 conversations=None, keep_alive=None, router=None,
+                 augment=None, augment_options=None, interaction_log=None, promoter=None):
+        self.instant = instant
+        self.retrieve = retrieve
+        self.model = model
+        self.build_messages = build_messages
+        self.options = options
+        self.system_prompt = system_prompt
+        self.fallback = fallback
+        self.generation_cache = generation_cache
+        self.timeouts = {**TIEMPOS_LIMITE, **(timeouts or {})}
+        self.client = client or ollama.AsyncClient()
+        self._tasks = {}  # sesión -> set de tareas en curso
+        self.conversations = conversations
+        self.keep_alive = keep_alive
+        self.router = router
+        self.augment = augment
+        self.augment_options = augment_options
+        self.interaction_log = interaction_log
+        self.promoter = promoter
+        self.speculative = speculative
+        self.speculation_delay = speculation_delay
+        self.max_speculative = max_speculative
+        self._speculating = 0
+        self.speculation_stats = {
+            "started": 0,       # generaciones lanzadas en paralelo
+            "used": 0,          # la búsqueda falló y se aprovechó la generación
+            "wasted": 0,        # la búsqueda acertó y se canceló la generación
+            "skipped": 0,       # no se especuló por alcanzar max_speculative
+            "saved_time": 0.0,  # segundos de solapamiento aprovechados
+            "wasted_time": 0.0, # segundos de generación descartados
+        }
+
+    async def run(self, session_id, user_input, on_chunk=None):
+        """Responde dentro de una sesión; la tarea queda registrada para poder cancelarla"""
+        task = asyncio.current_task()
+        self._tasks.setdefault(session_id, set()).add(task)
+        try:
+            return await self.respond(user_input, on_chunk, session_id)
+        finally:
+            tasks = self._tasks.get(session_id)
+            if tasks is not None:
+                tasks.discard(task)
+                if not tasks:
+                    del self._tasks[session_id]
+
+    def cancel(self, session_id):
+        """Cancela las peticiones en curso de la sesión (llamar desde el bucle)"""
+        for task in list(self._tasks.get(session_id, ())):
+            task.cancel()
+
+    def active_sessions(self):
+        return list(self._tasks)
+
+    async def respond(self, user_input, on_chunk=None, session_id=None):
+        conversation = None
+        if self.conversations is not None and session_id is not None:
+            conversation = self.conversations.get(session_id)
+
+        with metrics.trace(session_id) as trace:
+            result = await self._respond(user_input, on_chunk, time.perf_counter(), conversation)
+            trace.tier = result.tier
+        if self.interaction_log:
+            self.interaction_log.record_result(user_input, result, session_id)
+        if self.promoter:
+            self.promoter.observe(user_input, result, not result.with_history)
+        if conversation is not None and result.text:
+            conversation.add_turn(user_input, result.text, result.prompt_tokens,
+                                  result.total_time if result.tier == "llm" else None)
+            if conversation.needs_compaction():
+                conversation.compact()
+        return result
+
+    async def _respond(self, user_input, on_chunk, start_time, conversation):
+        # 1. Respuesta instantánea (milisegundos)
+        with span("instant"):
+            instant = self.instant(user_input)
+        if instant:
+            return EngineResult("instant", instant, total_time=time.perf_counter() - start_time)
+
+        if self.speculative:
+            if self._speculating < self.max_speculative:
+                return await self._respond_speculative(user_input, on_chunk, start_time, conversation)
+            self.speculation_stats["skipped"] += 1
+
+        # 2. Base de datos en un hilo, con tiempo límite
+        db_response, score, context = await self._retrieve(user_input)
+        if db_response:
+            return EngineResult("db", db_response, total_time=time.perf_counter() - start_time, score=score)
+
+        # 3. Ollama (puede tomar segundos)
+        return await self._generate(user_input, on_chunk, start_time, conversation, score, context)
+
+    async def _respond_speculative(self, user_input, on_chunk, start_time, conversation=None):
+        retrieval = asyncio.ensure_future(self._retrieve(user_input))
+        try:
+            done, _ = await asyncio.wait({retrieval}, timeout=self.speculation_delay)
+        except asyncio.CancelledError:
+            retrieval.cancel()
+            raise
+        if retrieval in done:
+            db_response, score, context = retrieval.result()
+            if db_response:
+                return EngineResult("db", db_response, total_time=time.perf_counter() - start_time, score=score)
+            return await self._generate(user_input, on_chunk, start_time, conversation, score, context)
+
+        # La búsqueda va lenta: se lanza Ollama en paralelo
+        gate = _ChunkGate()
+        llm_start = time.perf_counter()
+        self._speculating += 1
+        self.speculation_stats["started"] += 1
+        llm = asyncio.ensure_future(self._generate(user_input, gate, start_time, conversation))
+        llm.add_done_callback(self._speculation_done)
+        try:
+            db_response, score, _ = await retrieval
+        except asyncio.CancelledError:
+            llm.cancel()
+            raise
+        overlap = time.perf_counter() - llm_start
+
+        if db_response:
+            llm.cancel()
+            self.speculation_stats["wasted"] += 1
+            self.speculation_stats["wasted_time"] += overlap
+            return EngineResult("db", db_response, total_time=time.perf_counter() - start_time, score=score)
+
+        self.speculation_stats["used"] += 1
+        self.speculation_stats["saved_time"] += overlap
+        if on_chunk:
+            gate.open(on_chunk)
+        result = await llm
+        result.score = score
+        return result
+
+    def _speculation_done(self, task):
+        self._speculating -= 1
+
+    def speculation_report(self):
+        stats = dict(self.speculation_stats)
+        started = stats["started"]
+        stats["waste_rate"] = stats["wasted"] / started if started else 0.0
+        stats["in_flight"] = self._speculating
+        return stats
+
+    async def _retrieve(self, user_input):
+        try:
+            with span("db"):
+                return await asyncio.wait_for(
+                    asyncio.to_thread(self.retrieve, user_input), self.timeouts["db"]
+                )
+        except asyncio.TimeoutError:
+            print(f"Tiempo límite en base de datos ({self.timeouts['db']}s)")
+            return None, None, []
+
+    async def _generate(self, user_input, on_chunk, start_time, conversation=None, score=None, context=None):
+        model, options, decision = self.model, self.options, None
+        if self.router:
+            decision = self.router.route(user_input, score)
+            model, options = decision.model, decision.options
+
+        messages = None
+        if conversation is None and not self.augment:
+            context = None
+        follow_up = conversation is not None and conversation.has_history and is_follow_up(user_input)
+        if follow_up:
+            messages = conversation.build_messages(user_input, context)
+        elif context:
+            messages = (self.augment(user_input, context) if self.augment
+                        else conversation.build_messages(user_input, context, history=False))
+        if context and self.augment_options:
+            options = {**(options or {}), **self.augment_options}
+
+        # Con historial o contexto la respuesta depende de algo más que el prompt
+        cache = self.generation_cache if messages is None else None
+        if cache:
+            cached = cache.get(model, self.system_prompt, options, user_input)
+            if cached:
+                if on_chunk:
+                    on_chunk(cached)
+                elapsed = time.perf_counter() - start_time
+                return EngineResult("llm", cached, first_token_time=elapsed, total_time=elapsed, model=model)
+
+        if messages is None:
+            messages = self.build_messages(user_input)
+        parts = []
+        first_token_time = None
+        prompt_tokens = None
+        llm_start = time.perf_counter()
+
+        async def consume():
+            nonlocal first_token_time, prompt_tokens
+            extra = {"keep_alive": self.keep_alive} if self.keep_alive is not None else {}
+            stream = await self.client.chat(
+                model=model,
+                messages=messages,
+                options=options,
+                stream=True,
+                **extra,
+            )
+            async for chunk in stream:
+                if chunk.get('prompt_eval_count'):
+                    prompt_tokens = chunk['prompt_eval_count']
+                content = chunk['message']['content']
+                if not content:
+                    continue
+                if first_token_time is None:
+                    first_token_time = time.perf_counter() - start_time
+                    metrics.record("llm.first_token", time.perf_counter() - llm_start)
+                parts.append(content)
+                if on_chunk:
+                    on_chunk(content)
+
+        try:
+            await asyncio.wait_for(consume(), self.timeouts["llm"])
+        except asyncio.TimeoutError:
+            print(f"Tiempo límite en Ollama ({self.timeouts['llm']}s)")
+        except Exception as e:
+            print(f"Error Ollama: {e}")
+
+        total_time = time.perf_counter() - start_time
+        if first_token_time is not None:
+            metrics.record("llm.generation", total_time - first_token_time)
+        if not parts:
+            text = self.fallback(user_input) if self.fallback else ""
+            if on_chunk and text:
+                on_chunk(text)
+            result = EngineResult("fallback", text, first_token_time=total_time, total_time=total_time, model=model,
+                                  score=score)
+        else:
+            text = "".join(parts)
+            if cache:
+                cache.set(model, self.system_prompt, options, user_input, text)
+            if prompt_tokens is None:
+                prompt_tokens = sum(estimate_tokens(m['content']) for m in messages)
+            result = EngineResult("llm", text, first_token_time=first_token_time,
+                                  total_time=total_time, prompt_tokens=prompt_tokens, model=model, score=score,
+                                  with_history=follow_up)
+        if decision:
+            self.router.record(decision, result)
+        return result
+
+
+class _ChunkGate:
+    """Retiene los fragmentos de una generación especulativa hasta confirmarla"""
+
+    def __init__(self):
+        self.buffer = []
+        self.target = None
+
+    def __call__(self, chunk):
+        if self.target:
+            self.target(chunk)
+        else:
+            self.buffer.append(chunk)
+
+    def open(self, target):
+        for chunk in self.buffer:
+            target(chunk)
+        self.buffer.clear()
+        self.target = target
+
+
+# -----------------------------
+# PUENTE HILO ↔ ASYNCIO (PARA TKINTER)
+# -----------------------------
+class EngineBridge:
+    """Ejecuta el bucle asyncio en un hilo propio y expone una API segura entre hilos"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self._thread.start()
+
+    def submit(self, session_id, user_input, on_chunk=None):
+        """Retorna un concurrent.futures.Future con el EngineResult"""
+        return asyncio.run_coroutine_threadsafe(
+            self.engine.run(session_id, user_input, on_chunk), self.loop
+        )
+
+    def cancel(self, session_id):
+        self.loop.call_soon_threadsafe(self.engine.cancel, session_id)
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=5)
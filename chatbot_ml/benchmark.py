@@ -0,0 +1,296 @@
+import argparse
+import asyncio
+import gc
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+# -----------------------------
+# BENCHMARK Y PRUEBA DE CARGA DE LA JERARQUÍA DE RESPUESTAS
+# -----------------------------
+TAMANOS = (1_000, 10_000, 100_000, 1_000_000)
+TOLERANCIA = 0.10  # Empeoramiento relativo que se considera regresión
+
+TEMAS = [
+    "python", "java", "redes neuronales", "bases de datos", "sql", "docker", "kubernetes",
+    "machine learning", "inteligencia artificial", "algoritmos", "estructuras de datos",
+    "criptografía", "linux", "windows", "git", "apis rest", "microservicios", "html", "css",
+    "javascript", "estadística", "probabilidad", "álgebra lineal", "cálculo", "física",
+    "química", "biología", "historia", "geografía", "economía", "marketing", "finanzas",
+]
+PLANTILLAS = [
+    "qué es {t} {n}", "cómo funciona {t} {n}", "para qué sirve {t} {n}",
+    "cuál es la diferencia entre {t} y {u} {n}", "cómo aprendo {t} {n}",
+    "ejemplos de {t} en {u} {n}", "ventajas de {t} {n}", "historia de {t} {n}",
+]
+RELLENO = ["por favor", "oye", "dime", "me explicas", "una pregunta", "rápido"]
+FUERA = ["volcanes", "recetas", "fútbol", "jardinería", "astronomía", "poesía", "ajedrez", "cine"]
+INSTANTANEAS = ["hola", "gracias", "qué hora es", "adiós", "cómo estás"]
+
+
+def synthetic_rows(n, rng):
+    """Filas (pregunta, respuesta) únicas a partir de plantillas y un sufijo numérico"""
+    rows = []
+    for i in range(n):
+        template = PLANTILLAS[i % len(PLANTILLAS)]
+        question = template.format(t=rng.choice(TEMAS), u=rng.choice(TEMAS), n=f"caso{i}")
+        rows.append((question, f"Respuesta sintética número {i}."))
+    return rows
+
+
+def paraphrase(question, rng):
+    words = question.split()
+    change = rng.randrange(3)
+    if change == 0 and len(words) > 3:
+        words.pop(rng.randrange(1, len(words) - 1))
+    elif change == 1:
+        words.insert(0, rng.choice(RELLENO))
+    else:
+        words = [w.upper() if rng.random() < 0.3 else w for w in words] + ["?"]
+    return " ".join(words)
+
+
+def synthetic_queries(rows, n, hit_ratio, paraphrase_rate, instant_ratio, rng):
+    """Consultas etiquetadas: (texto, nivel esperado)"""
+    queries = []
+    for i in range(n):
+        r = rng.random()
+        if r < instant_ratio:
+            queries.append((rng.choice(INSTANTANEAS), "instant"))
+        elif r < instant_ratio + hit_ratio * (1 - instant_ratio):
+            question = rng.choice(rows)[0]
+            if rng.random() < paraphrase_rate:
+                question = paraphrase(question, rng)
+            queries.append((question, "db"))
+        else:
+            queries.append((f"{rng.choice(FUERA)} {rng.choice(FUERA)} tema{i}", "llm"))
+    return queries
+
+
+def percentiles(values):
+    values = sorted(values)
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0}
+    pick = lambda q: values[min(len(values) - 1, int(q * len(values)))]
+    return {"p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99)}
+
+
+def rss_mb():
+    """Memoria residente máxima del proceso (MB), si la plataforma lo permite"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def time_sync(fn, queries):
+    latencies = []
+    for text, _ in queries:
+        start = time.perf_counter()
+        fn(text)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+async def run_engine(engine, queries, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    results = []
+
+    async def one(i, text):
+        async with semaphore:
+            result = await engine.run(f"bench{i}", text)
+            results.append(result)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i, text) for i, (text, _) in enumerate(queries)))
+    return results, time.perf_counter() - start
+
+
+async def check_sessions(core, args, rows):
+    """Motor con la configuración por defecto (memoria de conversación incluida):
+    varios turnos en una misma sesión deben responder sin excepciones"""
+    from ollama_stub import StubAsyncClient
+
+    engine = core.create_engine(
+        client=StubAsyncClient(latency=args.llm_latency, tokens_per_second=args.llm_tps),
+        generation_cache=None,
+        interaction_log=None,
+    )
+    prompts = ["hola", rows[0][0], f"{FUERA[0]} {FUERA[1]}", "y eso por qué"]
+    return [(await engine.run("check", prompt)).tier for prompt in prompts]
+
+
+# -----------------------------
+# EJECUCIÓN POR TAMAÑO DE TABLA
+# -----------------------------
+def prepare_core(core, rows, workdir):
+    """Apunta chatbot_core a una base SQLite sintética y construye el índice"""
+    from knowledge_repository import KnowledgeRepository, SQLiteBackend
+
+    db_path = os.path.join(workdir, f"knowledge_{len(rows)}.db")
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    core.repository = KnowledgeRepository(SQLiteBackend(db_path))
+    with core.repository.backend.connection() as conn:
+        conn.execute("BEGIN")
+        conn.executemany("INSERT INTO knowledge (question, answer) VALUES (?, ?)", rows)
+        conn.execute("COMMIT")
+    core.RUTA_INDICE = os.path.join(workdir, f"index_{len(rows)}")
+    core.knowledge_index = None
+    core.respuestas_cache.clear()
+    core.retrieval_log = None  # El tráfico sintético no debe calibrar el umbral real
+
+    start = time.perf_counter()
+    core.load_knowledge_index()
+    return time.perf_counter() - start
+
+
+def run_size(core, size, args, workdir):
+    from ollama_stub import StubAsyncClient
+
+    rng = random.Random(args.seed)
+    rows = synthetic_rows(size, rng)
+    build_time = prepare_core(core, rows, workdir)
+    session_tiers = asyncio.run(check_sessions(core, args, rows))
+    queries = synthetic_queries(rows, args.queries, args.hit_ratio, args.paraphrase_rate, args.instant_ratio, rng)
+    del rows
+    gc.collect()
+    if args.retrieval_processes:
+        core.start_retrieval_pool(core.knowledge_index, workers=args.retrieval_processes)
+
+    instant = percentiles(time_sync(core.get_instant_response, queries))
+    core.respuestas_cache.clear()
+    db = percentiles(time_sync(core.get_db_response, queries))
+    core.respuestas_cache.clear()
+
+    engine_options = {"speculative": args.speculative}
+    if args.speculation_delay is not None:
+        engine_options["speculation_delay"] = args.speculation_delay
+    engine = core.create_engine(
+        client=StubAsyncClient(latency=args.llm_latency, tokens_per_second=args.llm_tps),
+        generation_cache=None,
+        conversations=None,
+        interaction_log=None,
+        **engine_options,
+    )
+    results, wall = asyncio.run(run_engine(engine, queries, args.concurrency))
+    pool_stats = core.retrieval_pool.stats() if core.retrieval_pool else None
+    core.stop_retrieval_pool()
+
+    tiers = {}
+    by_tier = {}
+    for result in results:
+        tiers[result.tier] = tiers.get(result.tier, 0) + 1
+        by_tier.setdefault(result.tier, []).append(result.total_time)
+    expected_db = sum(1 for _, tier in queries if tier == "db")
+
+    return {
+        "rows": size,
+        "index_build_s": build_time,
+        "get_instant_response": instant,
+        "get_db_response": db,
+        "get_response": {
+            "throughput_qps": len(results) / wall if wall else 0.0,
+            **percentiles([r.total_time for r in results]),
+            "by_tier": {tier: percentiles(times) for tier, times in by_tier.items()},
+        },
+        "tier_distribution": {tier: count / len(results) for tier, count in tiers.items()},
+        "db_recall": tiers.get("db", 0) / expected_db if expected_db else None,
+        "rss_mb": rss_mb(),
+        "retrieval_pool": pool_stats,
+        "speculation": engine.speculation_report() if args.speculative else None,
+        "session_check": session_tiers,
+    }
+
+
+# -----------------------------
+# COMPARACIÓN CON LÍNEA BASE
+# -----------------------------
+def compare(report, baseline, tolerance=TOLERANCIA):
+    """Lista de regresiones (latencias que suben o throughput que baja más de `tolerance`)"""
+    regressions = []
+    previous = {entry["rows"]: entry for entry in baseline["results"]}
+    for entry in report["results"]:
+        old = previous.get(entry["rows"])
+        if not old:
+            continue
+        checks = [
+            ("get_instant_response.p95", entry["get_instant_response"]["p95"], old["get_instant_response"]["p95"], 1),
+            ("get_db_response.p95", entry["get_db_response"]["p95"], old["get_db_response"]["p95"], 1),
+            ("get_response.p99", entry["get_response"]["p99"], old["get_response"]["p99"], 1),
+            ("get_response.throughput_qps", entry["get_response"]["throughput_qps"],
+             old["get_response"]["throughput_qps"], -1),
+        ]
+        for name, new_value, old_value, direction in checks:
+            if old_value and direction * (new_value - old_value) / old_value > tolerance:
+                regressions.append(f"{entry['rows']} filas · {name}: {old_value:.6g} → {new_value:.6g}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline de la jerarquía de respuestas")
+    parser.add_argument("--sizes", default="1000,10000",
+                        help=f"Tamaños de tabla separados por comas (p. ej. {','.join(map(str, TAMANOS))})")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--hit-ratio", type=float, default=0.6, help="Fracción de consultas presentes en knowledge")
+    parser.add_argument("--paraphrase-rate", type=float, default=0.3, help="Fracción de aciertos parafraseados")
+    parser.add_argument("--instant-ratio", type=float, default=0.1)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Latencia simulada de Ollama (s)")
+    parser.add_argument("--llm-tps", type=float, default=500.0, help="Tokens por segundo simulados")
+    parser.add_argument("--retrieval-processes", type=int, default=0,
+                        help="Procesos de RetrievalPool para puntuar TF-IDF (0 = en el propio proceso)")
+    parser.add_argument("--speculative", action="store_true",
+                        help="Lanza Ollama en paralelo con la búsqueda (informa del tiempo ahorrado y desperdiciado)")
+    parser.add_argument("--speculation-delay", type=float, help="Segundos de búsqueda antes de especular")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Guarda el informe JSON")
+    parser.add_argument("--baseline", help="Informe JSON previo con el que comparar")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCIA)
+    args = parser.parse_args()
+
+    import chatbot_core as core
+
+    report = {"config": vars(args), "results": []}
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in (int(s) for s in args.sizes.split(",")):
+            print(f"▶ {size} filas...", flush=True)
+            entry = run_size(core, size, args, workdir)
+            report["results"].append(entry)
+            print(
+                f"  índice {entry['index_build_s']:.2f}s | db p95 {1000 * entry['get_db_response']['p95']:.2f}ms | "
+                f"{entry['get_response']['throughput_qps']:.0f} q/s, p99 {entry['get_response']['p99']:.3f}s | "
+                f"niveles {json.dumps({k: round(v, 3) for k, v in entry['tier_distribution'].items()})}",
+                flush=True,
+            )
+            if entry["speculation"]:
+                spec = entry["speculation"]
+                print(
+                    f"  especulación: {spec['started']} lanzadas, {spec['used']} usadas, {spec['wasted']} descartadas "
+                    f"({100 * spec['waste_rate']:.0f}%) | ahorrado {spec['saved_time']:.2f}s, "
+                    f"desperdiciado {spec['wasted_time']:.2f}s",
+                    flush=True,
+                )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print("❌ Regresiones respecto a la línea base:")
+            for line in regressions:
+                print(f"  - {line}")
+            sys.exit(1)
+        print("✅ Sin regresiones respecto a la línea base")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,205 +1,26 @@
 import tkinter as tk
 from tkinter import simpledialog, scrolledtext, ttk
-import mysql.connector
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-import datetime
-import ollama
-import threading
-import time
+import os
+import queue
+from collections import deque
+from async_engine import EngineBridge
+from chatbot_core import create_engine, generation_cache, learn_new_qa, load_knowledge_index, model_manager, start_logging, start_promoter, stop_promoter
+from metrics import metrics
+from model_manager import ESTADOS
+from transcript import TranscriptStore
 
 # -----------------------------
-# CONFIGURACIÓN RÁPIDA
+# CONFIGURACIÓN DE LA INTERFAZ
 # -----------------------------
-MODELO_OLLAMA = "llama3.2:1b"  # Cambia por el modelo que tengas instalado
+STREAM_FLUSH_MS = 50  # Intervalo con el que el hilo principal atiende los eventos de otros hilos
+SESION_GUI = "gui"
+MOSTRAR_METRICAS = True  # Latencias p50/p95/p99 en el pie de la ventana
+METRICAS_REFRESCO_MS = 2000
+MAX_MENSAJES_VISIBLES = 200  # Los más antiguos pasan a disco
+PAGINA_MENSAJES = 50  # Mensajes que se recuperan al llegar arriba con el scroll
+RUTA_TRANSCRIPCION = os.path.join(os.path.dirname(os.path.abspath(__file__)), "transcript.jsonl")
 
-# -----------------------------
-# CONEXIÓN A BASE DE DATOS OPTIMIZADA
-# -----------------------------
-def connect_db():
-    try:
-        return mysql.connector.connect(
-            host="localhost",
-            user="root",
-            password="",
-            database="chatbot_db",
-            autocommit=True
-        )
-    except mysql.connector.Error as e:
-        print(f"Error de base de datos: {e}")
-        return None
-
-def get_all_data():
-    db = connect_db()
-    if db is None:
-        return []
-    
-    try:
-        cursor = db.cursor()
-        cursor.execute("SELECT question, answer FROM knowledge")
-        data = cursor.fetchall()
-        return data
-    except mysql.connector.Error as e:
-        print(f"Error al obtener datos: {e}")
-        return []
-    finally:
-        if db and db.is_connected():
-            db.close()
-
-def insert_new_qa(question, answer):
-    db = connect_db()
-    if db is None:
-        return False
-    
-    try:
-        cursor = db.cursor()
-        cursor.execute("INSERT INTO knowledge (question, answer) VALUES (%s, %s)", (question, answer))
-        db.commit()
-        return True
-    except mysql.connector.Error as e:
-        print(f"Error al insertar datos: {e}")
-        return False
-    finally:
-        if db.is_connected():
-            db.close()
-
-# -----------------------------
-# SISTEMA DE CACHÉ PARA RESPUESTAS RÁPIDAS
-# -----------------------------
-respuestas_cache = {}
-
-def get_cached_response(user_input):
-    """Retorna respuesta del cache si existe"""
-    low_input = user_input.lower().strip()
-    return respuestas_cache.get(low_input)
-
-def add_to_cache(user_input, response):
-    """Agrega respuesta al cache"""
-    low_input = user_input.lower().strip()
-    respuestas_cache[low_input] = response
-
-# -----------------------------
-# RESPUESTAS INSTANTÁNEAS MEJORADAS
-# -----------------------------
-def get_instant_response(prompt):
-    """Respuestas locales ultra-rápidas"""
-    low = prompt.lower().strip()
-    
-    # Diccionario expandido de respuestas instantáneas
-    instant_responses = {
-        "hola": "¡Hola! 😊 ¿En qué puedo ayudarte hoy?",
-        "hello": "Hello! 👋 How can I assist you?",
-        "adiós": "¡Hasta luego! 👋 Que tengas un excelente día.",
-        "chao": "¡Chao! 😊 Espero verte pronto.",
-        "bye": "Goodbye! 👋 Have a great day!",
-        "gracias": "¡De nada! 💙 Me encanta ayudarte.",
-        "thanks": "You're welcome! 💙 Happy to help!",
-        "cómo estás": "¡Estoy funcionando perfectamente! 🤖 ¿Y tú cómo estás?",
-        "quién eres": "Soy tu asistente de IA inteligente 🧠 con Ollama local. Aprendo de cada conversación.",
-        "qué puedes hacer": "Puedo: • Responder preguntas • Aprender nuevas cosas • Conversar • Ayudarte con información • Y mucho más! 🚀",
-        "qué es la inteligencia artificial": "La IA es la simulación de procesos de inteligencia humana por máquinas. Incluye aprendizaje automático, razonamiento y autocorrección. 🤖",
-        "qué es python": "Python es un lenguaje de programación versátil y fácil de aprender, ideal para IA, web, datos y automatización. 🐍",
-        "qué es machine learning": "El Machine Learning es una rama de la IA donde las máquinas aprenden patrones de datos sin programación explícita. 📊",
-        "qué hora es": f"🕐 Son las {datetime.datetime.now().strftime('%H:%M:%S')}",
-        "qué día es hoy": f"📅 Hoy es {datetime.datetime.now().strftime('%A, %d de %B de %Y')}",
-        "cuál es la fecha": f"📅 La fecha actual es {datetime.datetime.now().strftime('%d/%m/%Y')}",
-        "cómo te llamas": "Me llamo Asistente IA 🤖 ¡Mucho gusto!",
-        "quién te creó": "Fui creado para ayudarte con tus preguntas y tareas usando tecnología de IA local. 🚀"
-    }
-    
-    # Búsqueda inteligente en el diccionario
-    for key, value in instant_responses.items():
-        if key in low:
-            return value
-    
-    # Respuestas basadas en patrones
-    if any(palabra in low for palabra in ["hora"]):
-        return f"🕐 Son las {datetime.datetime.now().strftime('%H:%M:%S')}"
-    
-    if any(palabra in low for palabra in ["fecha", "día es"]):
-        return f"📅 Hoy es {datetime.datetime.now().strftime('%A, %d de %B de %Y')}"
-    
-    return None
-
-# -----------------------------
-# CHATBOT CON BASE DE DATOS OPTIMIZADO
-# -----------------------------
-def get_db_response(user_input):
-    """Búsqueda en base de datos con cache"""
-    # Primero verificar cache
-    cached = get_cached_response(user_input)
-    if cached:
-        return cached, 1.0
-    
-    data = get_all_data()
-    if not data:
-        return None, 0.0
-
-    questions = [row[0] for row in data]
-    answers = [row[1] for row in data]
-
-    try:
-        vectorizer = TfidfVectorizer()
-        vectors = vectorizer.fit_transform(questions + [user_input])
-        similarity = cosine_similarity(vectors[-1], vectors[:-1])
-        index = similarity.argmax()
-
-        if similarity[0][index] > 0.45:
-            response = answers[index]
-            add_to_cache(user_input, response)  # Cachear resultado
-            return response, similarity[0][index]
-        else:
-            return None, similarity[0][index]
-    except Exception as e:
-        print(f"Error en procesamiento de texto: {e}")
-        return None, 0.0
-
-# -----------------------------
-# OLLAMA OPTIMIZADO CON TIMEOUT
-# -----------------------------
-def get_ollama_response(prompt):
-    """Respuesta de Ollama con timeout y optimizaciones"""
-    try:
-        # Configuración optimizada para respuestas rápidas
-        response = ollama.chat(
-            model=MODELO_OLLAMA,
-            messages=[
-                {
-                    'role': 'system', 
-                    'content': 'Eres un asistente útil y conciso. Responde máximo 2 párrafos en español. Sé directo y claro. Responde en 100 palabras máximo.'
-                },
-                {
-                    'role': 'user', 
-                    'content': prompt
-                }
-            ],
-            options={
-                'temperature': 0.3,  # Menos creatividad = más rápido
-                'num_predict': 120,  # Limitar longitud
-            }
-        )
-        return response['message']['content']
-    except Exception as e:
-        print(f"Error Ollama: {e}")
-        return f"💡 Basándome en tu pregunta sobre '{prompt}', es un tema interesante. ¿Te gustaría que aprenda más sobre esto?"
-
-# -----------------------------
-# SISTEMA DE RESPUESTAS JERÁRQUICO
-# -----------------------------
-def get_response(user_input):
-    """Sistema optimizado de respuestas"""
-    # 1. Respuesta instantánea (milisegundos)
-    instant = get_instant_response(user_input)
-    if instant:
-        return instant
-    
-    # 2. Base de datos con cache (rápido)
-    db_response, score = get_db_response(user_input)
-    if db_response:
-        return db_response
-    
-    # 3. Ollama (puede tomar segundos)
-    return get_ollama_response(user_input)
+engine_bridge = None  # Se crea en __main__: los procesos hijos (spawn) reimportan este módulo
 
 # -----------------------------
 # INTERFAZ GRÁFICA MEJORADA Y CORREGIDA
@@ -207,9 +28,18 @@ def get_response(user_input):
 class ChatbotGUI:
     def __init__(self, root):
         self.root = root
+        self.messages = deque()  # Mensajes en el widget: {"index", "mark", "segments"}
+        self.next_message = 0
+        self.loading_older = False
+        self.transcript = TranscriptStore(RUTA_TRANSCRIPCION)
         self.setup_ui()
         self.is_processing = False
         self.typing_indicator_id = None
+        # Eventos (tipo, datos) del motor y del gestor del modelo; solo el hilo principal toca Tk
+        self.stream_queue = queue.Queue()
+        self.streaming = False
+        model_manager.add_listener(lambda state, text: self.stream_queue.put(("status", (state, text))))
+        self.root.after(STREAM_FLUSH_MS, self.poll_events)
         
     def setup_ui(self):
         # Configuración principal
@@ -265,14 +95,19 @@ class ChatbotGUI:
         )
         title_label.pack(side=tk.LEFT)
         
-        status_label = tk.Label(
+        self.status_label = tk.Label(
             header_frame,
-            text="🟢 Conectado - Ollama Local",
+            text=ESTADOS["unknown"],
             font=("Arial", 10),
             bg=self.colors['dark_bg'],
-            fg=self.colors['success']
+            fg=self.colors['text_muted']
         )
-        status_label.pack(side=tk.RIGHT)
+        self.status_label.pack(side=tk.RIGHT)
+    
+    def update_status(self, state, text):
+        """Refleja en la cabecera el estado real de Ollama"""
+        colors = {"ready": self.colors['success'], "missing": '#ef476f', "offline": '#ef476f'}
+        self.status_label.config(text=text, fg=colors.get(state, '#ff9e00'))
     
     def setup_chat_area(self, parent):
         chat_container = tk.Frame(parent, bg=self.colors['card_bg'], relief=tk.FLAT, bd=1)
@@ -291,6 +126,7 @@ class ChatbotGUI:
             insertbackground=self.colors['text_light']  # Color del cursor
         )
         self.chat_window.pack(fill=tk.BOTH, expand=True)
+        self.chat_window.configure(yscrollcommand=self.on_scroll)
         
         # Configurar estilos de texto
         self.chat_window.tag_config("user", foreground="#3a86ff", font=("Arial", 11, "bold"))
@@ -335,6 +171,22 @@ class ChatbotGUI:
         )
         self.send_button.pack(side=tk.RIGHT)
         
+        # Botón detener generación
+        self.stop_button = tk.Button(
+            controls_frame,
+            text="⏹ Detener",
+            command=self.stop_generation,
+            bg='#ef476f',
+            fg=self.colors['text_light'],
+            font=("Arial", 10),
+            relief=tk.FLAT,
+            bd=0,
+            padx=15,
+            pady=8,
+            state=tk.DISABLED
+        )
+        self.stop_button.pack(side=tk.RIGHT, padx=(0, 10))
+        
         # Botón limpiar
         clear_button = tk.Button(
             controls_frame,
@@ -354,14 +206,85 @@ class ChatbotGUI:
         footer_frame = tk.Frame(parent, bg=self.colors['dark_bg'])
         footer_frame.pack(fill=tk.X)
         
-        status_text = tk.Label(
+        self.footer_label = tk.Label(
             footer_frame,
             text="⚡ Respuestas instantáneas | 💾 Cache activado | 🧠 Ollama Local",
             font=("Arial", 9),
             bg=self.colors['dark_bg'],
             fg=self.colors['text_muted']
         )
-        status_text.pack()
+        self.footer_label.pack()
+        
+        if MOSTRAR_METRICAS:
+            self.root.after(METRICAS_REFRESCO_MS, self.update_metrics_footer)
+    
+    def update_metrics_footer(self):
+        """Muestra p50/p95/p99 y el reparto por nivel en el pie"""
+        text = metrics.footer_text()
+        if text:
+            self.footer_label.config(text=text)
+        self.root.after(METRICAS_REFRESCO_MS, self.update_metrics_footer)
+    
+    # -----------------------------
+    # HISTORIAL ACOTADO (MARCAS TK + TRANSCRIPCIÓN EN DISCO)
+    # -----------------------------
+    def begin_message(self):
+        """Abre un mensaje nuevo al final; recorta a disco los que sobran por arriba"""
+        mark = f"msg{self.next_message}"
+        self.chat_window.mark_set(mark, "end-1c")
+        self.chat_window.mark_gravity(mark, tk.LEFT)
+        self.messages.append({"index": self.next_message, "mark": mark, "segments": []})
+        self.next_message += 1
+        while len(self.messages) > MAX_MENSAJES_VISIBLES:
+            self.trim_oldest_message()
+    
+    def append(self, text, tag):
+        """Inserta al final y lo anota en el mensaje actual"""
+        self.chat_window.insert(tk.END, text, tag)
+        segments = self.messages[-1]["segments"]
+        if segments and segments[-1][1] == tag:
+            segments[-1][0] += text
+        else:
+            segments.append([text, tag])
+        self.chat_window.see(tk.END)
+    
+    def trim_oldest_message(self):
+        oldest = self.messages.popleft()
+        if oldest["index"] >= len(self.transcript):  # Los recuperados con el scroll ya están en disco
+            self.transcript.append(oldest["segments"])
+        self.chat_window.delete(oldest["mark"], self.messages[0]["mark"])
+        self.chat_window.mark_unset(oldest["mark"])
+    
+    def on_scroll(self, first, last):
+        self.chat_window.vbar.set(first, last)
+        if float(first) <= 0.0 and self.messages and self.messages[0]["index"] > 0 and not self.loading_older:
+            self.loading_older = True
+            self.root.after_idle(self.load_older_messages)
+    
+    def load_older_messages(self):
+        """Recupera de disco la página anterior al primer mensaje visible"""
+        first = self.messages[0]
+        start = max(0, first["index"] - PAGINA_MENSAJES)
+        older = self.transcript.read(start, first["index"])
+        
+        # La marca del primer mensaje debe quedarse pegada a su texto
+        self.chat_window.mark_gravity(first["mark"], tk.RIGHT)
+        self.chat_window.mark_set("paging", "1.0")
+        self.chat_window.mark_gravity("paging", tk.RIGHT)
+        loaded = []
+        for index, segments in enumerate(older, start):
+            mark = f"msg{index}"
+            self.chat_window.mark_set(mark, "paging")
+            self.chat_window.mark_gravity(mark, tk.LEFT)
+            for text, tag in segments:
+                self.chat_window.insert("paging", text, tag)
+            loaded.append({"index": index, "mark": mark, "segments": segments})
+        self.chat_window.mark_unset("paging")
+        self.chat_window.mark_gravity(first["mark"], tk.LEFT)
+        self.messages.extendleft(reversed(loaded))
+        
+        self.chat_window.yview(first["mark"])  # Mantiene la posición de lectura
+        self.loading_older = False
     
     def show_welcome_message(self):
         welcome_text = """🤖 Bot: ¡Hola! Soy tu asistente ultra-rápido 🚀
@@ -380,11 +303,19 @@ class ChatbotGUI:
 • "¿Qué es Python?" 🐍
 
 """
-        self.chat_window.insert(tk.END, welcome_text, "system")
-        self.chat_window.see(tk.END)
+        self.begin_message()
+        self.append(welcome_text, "system")
     
     def clear_chat(self):
+        if engine_bridge.engine.conversations is not None:
+            engine_bridge.engine.conversations.reset(SESION_GUI)
         self.chat_window.delete(1.0, tk.END)
+        for message in self.messages:
+            self.chat_window.mark_unset(message["mark"])
+        self.messages.clear()
+        self.transcript.clear()
+        self.next_message = 0
+        self.typing_indicator_id = None
         self.show_welcome_message()
     
     def send_message(self, event=None):
@@ -396,74 +327,121 @@ class ChatbotGUI:
             return
 
         # Mostrar mensaje del usuario inmediatamente
-        self.chat_window.insert(tk.END, f"👤 Tú: {user_input}\n", "user")
-        self.chat_window.see(tk.END)
+        self.begin_message()
+        self.append(f"👤 Tú: {user_input}\n", "user")
         self.entry.delete(0, tk.END)
         
         # Deshabilitar entrada
         self.set_input_state(False)
         
-        # Procesar en hilo separado para no bloquear la interfaz
-        thread = threading.Thread(target=self.process_message, args=(user_input,))
-        thread.daemon = True
-        thread.start()
-    
-    def process_message(self, user_input):
+        # Procesar en el motor asíncrono para no bloquear la interfaz
         self.is_processing = True
+        self.stop_button.config(state=tk.NORMAL)
+        self.show_typing_indicator()
+        self.first_chunk = True
+        future = engine_bridge.submit(SESION_GUI, user_input, on_chunk=self.on_chunk)
+        future.add_done_callback(lambda f: self.stream_queue.put(("done", (f, user_input))))
+    
+    def on_chunk(self, chunk):
+        """Recibe fragmentos en el hilo del motor; la GUI los vuelca en el hilo principal"""
+        if self.first_chunk:
+            self.first_chunk = False
+            self.stream_queue.put(("start", None))
+        self.stream_queue.put(("chunk", chunk))
+    
+    def stop_generation(self):
+        engine_bridge.cancel(SESION_GUI)
+    
+    def on_engine_done(self, future, user_input):
+        self.is_processing = False
+        self.stop_button.config(state=tk.DISABLED)
+        
+        if future.cancelled():
+            self.streaming = False
+            self.hide_typing_indicator()
+            self.append(" ⏹ Cancelado\n\n", "system")
+            self.set_input_state(True)
+            return
         
         try:
-            # Mostrar indicador de typing (en el hilo principal)
-            self.root.after(0, self.show_typing_indicator)
-            
-            # Obtener respuesta
-            start_time = time.time()
-            response = get_response(user_input)
-            response_time = time.time() - start_time
-            
-            # Ocultar indicador y mostrar respuesta (en el hilo principal)
-            self.root.after(0, self.hide_typing_indicator)
-            self.root.after(0, self.display_response, response, response_time, user_input)
-            
+            result = future.result()
         except Exception as e:
-            self.root.after(0, self.hide_typing_indicator)
-            self.root.after(0, self.display_error, str(e))
+            self.hide_typing_indicator()
+            self.display_error(str(e))
+            return
         
-        self.is_processing = False
+        if result.tier in ("instant", "db"):
+            self.hide_typing_indicator()
+            self.display_response(result.text, result.total_time, user_input)
+        else:
+            self.finish_stream(result.text, result.first_token_time or result.total_time, result.total_time, user_input)
+    
+    def start_stream(self):
+        self.hide_typing_indicator()
+        self.begin_message()
+        self.append("🤖 Bot: ", "bot")
+        self.streaming = True
+    
+    def poll_events(self):
+        """Atiende en orden los eventos de los otros hilos (solo en el hilo principal);
+        los fragmentos consecutivos se vuelcan en bloque"""
+        chunks = []
+        while True:
+            try:
+                kind, payload = self.stream_queue.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "chunk":
+                chunks.append(payload)
+                continue
+            if chunks:
+                self.append("".join(chunks), "bot")
+                chunks = []
+            if kind == "start":
+                self.start_stream()
+            elif kind == "done":
+                self.on_engine_done(*payload)
+            elif kind == "status":
+                self.update_status(*payload)
+        if chunks:
+            self.append("".join(chunks), "bot")
+        self.root.after(STREAM_FLUSH_MS, self.poll_events)
+    
+    def finish_stream(self, response, first_token_time, total_time, user_input):
+        self.streaming = False
+        time_info = f" ⚡1er token {first_token_time:.1f}s · total {total_time:.1f}s"
+        self.append(f"{time_info}\n\n", "system")
+        self.after_response(response, user_input)
     
     def show_typing_indicator(self):
         """Mostrar indicador de que está escribiendo"""
         if self.typing_indicator_id is None:
+            # Entre dos marcas: se borra sin buscar en el texto
+            self.chat_window.mark_set("typing_start", "end-1c")
+            self.chat_window.mark_gravity("typing_start", tk.LEFT)
             self.chat_window.insert(tk.END, "🤖 Bot: ", "bot")
-            self.chat_window.insert(tk.END, "escribiendo", "typing")
-            self.chat_window.insert(tk.END, "...\n", "typing")
+            self.chat_window.insert(tk.END, "escribiendo...\n", "typing")
+            self.chat_window.mark_set("typing_end", "end-1c")
+            self.chat_window.mark_gravity("typing_end", tk.LEFT)
             self.typing_indicator_id = "typing"
             self.chat_window.see(tk.END)
     
     def hide_typing_indicator(self):
         """Ocultar indicador de escritura"""
         if self.typing_indicator_id:
-            # Buscar y eliminar la línea de "escribiendo..."
-            content = self.chat_window.get(1.0, tk.END)
-            lines = content.split('\n')
-            
-            for i, line in enumerate(lines, 1):
-                if "escribiendo..." in line:
-                    # Eliminar la línea completa
-                    start_index = f"{i}.0"
-                    end_index = f"{i+1}.0"
-                    self.chat_window.delete(start_index, end_index)
-                    break
-            
+            self.chat_window.delete("typing_start", "typing_end")
             self.typing_indicator_id = None
     
     def display_response(self, response, response_time, user_input):
         """Mostrar la respuesta en la interfaz"""
         # Mostrar respuesta con tiempo de procesamiento
         time_info = f" ⚡{response_time:.1f}s"
-        self.chat_window.insert(tk.END, f"🤖 Bot: {response}", "bot")
-        self.chat_window.insert(tk.END, f"{time_info}\n\n", "system")
-        self.chat_window.see(tk.END)
-        
+        self.begin_message()
+        self.append(f"🤖 Bot: {response}", "bot")
+        self.append(f"{time_info}\n\n", "system")
+        self.after_response(response, user_input)
+    
+    def after_response(self, response, user_input):
         # Preguntar por aprendizaje si fue respuesta de Ollama
         if not any(tag in response for tag in ["🕐", "📅", "¡Hola!", "Hello!", "¡De nada!", "You're welcome"]):
             self.root.after(1000, self.ask_for_learning, user_input)
@@ -472,8 +450,9 @@ class ChatbotGUI:
     
     def display_error(self, error_msg):
         """Mostrar mensaje de error"""
-        self.chat_window.insert(tk.END, f"🤖 Bot: ❌ Error: {error_msg}\n\n", "error")
-        self.chat_window.see(tk.END)
+        self.streaming = False
+        self.begin_message()
+        self.append(f"🤖 Bot: ❌ Error: {error_msg}\n\n", "error")
         self.set_input_state(True)
     
     def set_input_state(self, enabled):
@@ -497,12 +476,12 @@ class ChatbotGUI:
         )
         
         if user_answer and user_answer.strip():
-            success = insert_new_qa(user_input, user_answer.strip())
+            success = learn_new_qa(user_input, user_answer.strip())
+            self.begin_message()
             if success:
-                self.chat_window.insert(tk.END, "🤖 Bot: ¡✅ Aprendido! Respuesta guardada.\n\n", "bot")
+                self.append("🤖 Bot: ¡✅ Aprendido! Respuesta guardada.\n\n", "bot")
             else:
-                self.chat_window.insert(tk.END, "🤖 Bot: ❌ Error al guardar.\n\n", "error")
-            self.chat_window.see(tk.END)
+                self.append("🤖 Bot: ❌ Error al guardar.\n\n", "error")
         
         self.set_input_state(True)
 
@@ -510,6 +489,15 @@ class ChatbotGUI:
 # INICIALIZACIÓN
 # -----------------------------
 if __name__ == "__main__":
+    model_manager.start()  # Precarga el modelo en segundo plano
+    start_logging()
+    load_knowledge_index()
+    start_promoter()
+    engine_bridge = EngineBridge(create_engine())
     root = tk.Tk()
     app = ChatbotGUI(root)
-    root.mainloop()
\ No newline at end of file
+    root.mainloop()
+    app.transcript.close()
+    stop_promoter()
+    if generation_cache:
+        print(generation_cache.report())
\ No newline at end of file
@@ -1,59 +1,21 @@
 import tkinter as tk
 from tkinter import simpledialog, scrolledtext
-import mysql.connector
-from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 import datetime
 import ollama
+from knowledge_repository import create_repository
+from text_normalization import TextVectorizer
 
 # -----------------------------
-# CONEXIÓN A BASE DE DATOS
+# BASE DE DATOS (POOL DE CONEXIONES)
 # -----------------------------
-def connect_db():
-    try:
-        return mysql.connector.connect(
-            host="localhost",
-            user="root",
-            password="",
-            database="chatbot_db"
-        )
-    except mysql.connector.Error as e:
-        print(f"Error de base de datos: {e}")
-        return None
+repository = create_repository()
 
 def get_all_data():
-    db = connect_db()
-    if db is None:
-        return []
-    
-    try:
-        cursor = db.cursor()
-        cursor.execute("SELECT question, answer FROM knowledge")
-        data = cursor.fetchall()
-        return data
-    except mysql.connector.Error as e:
-        print(f"Error al obtener datos: {e}")
-        return []
-    finally:
-        if db and db.is_connected():
-            db.close()
+    return repository.get_all()
 
 def insert_new_qa(question, answer):
-    db = connect_db()
-    if db is None:
-        return False
-    
-    try:
-        cursor = db.cursor()
-        cursor.execute("INSERT INTO knowledge (question, answer) VALUES (%s, %s)", (question, answer))
-        db.commit()
-        return True
-    except mysql.connector.Error as e:
-        print(f"Error al insertar datos: {e}")
-        return False
-    finally:
-        if db.is_connected():
-            db.close()
+    return repository.insert(question, answer)
 
 # -----------------------------
 # CHATBOT LÓGICO (BASE DE DATOS - CORREGIDO)
@@ -68,7 +30,7 @@ def get_db_response(user_input):
 
     try:
         # CORRECCIÓN: Eliminado el parámetro stop_words no válido
-        vectorizer = TfidfVectorizer()
+        vectorizer = TextVectorizer()
         vectors = vectorizer.fit_transform(questions + [user_input])
         similarity = cosine_similarity(vectors[-1], vectors[:-1])
         index = similarity.argmax()
@@ -0,0 +1,368 @@
+import ollama
+import os
+import threading
+from async_engine import ResponseEngine
+from conversation import ConversationStore
+from embedding_index import EmbeddingIndex
+from generation_cache import GenerationCache
+from instant_responses import InstantMatcher
+from interaction_log import InteractionLog, SegmentWriter
+from knowledge_index import LOTE_LECTURA, UMBRAL_SIMILITUD, ShardedKnowledgeIndex
+from knowledge_promotion import AnswerPromoter
+from knowledge_repository import create_repository
+from llm_scheduler import LLMScheduler
+from metrics import metrics, span
+from model_manager import KEEP_ALIVE, ModelManager
+from model_router import RUTAS, ModelRouter
+from response_cache import ResponseCache
+from retrieval_pool import RetrievalPool
+from retrieval_ranking import K_CANDIDATOS, Candidate, RetrievalLog, decide, load_calibration, rerank
+
+# -----------------------------
+# CONFIGURACIÓN RÁPIDA
+# -----------------------------
+MODELO_OLLAMA = "llama3.2:1b"  # Cambia por el modelo que tengas instalado
+RUTA_INDICE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "knowledge_index")
+RUTA_CACHE_GENERACIONES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "generation_cache.db")
+RUTA_RESPUESTAS_INSTANTANEAS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "instant_responses.json")
+RUTA_INDICE_EMBEDDINGS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "knowledge_embeddings")
+USAR_EMBEDDINGS = False  # Nivel semántico opcional (requiere: ollama pull nomic-embed-text)
+USAR_CACHE_GENERACIONES = True  # Reutiliza respuestas de Ollama entre reinicios
+USAR_PLANIFICADOR = True  # Cola con single-flight y prioridad (ver OLLAMA_NUM_PARALLEL)
+USAR_MEMORIA = True  # Conversación multi-turno con presupuesto de tokens
+CONTEXTO_MAX_TOKENS = 1024
+CONTEXTO_FILAS = 2  # Filas de knowledge relacionadas que se pasan a Ollama
+CONTEXTO_SCORE_MIN = 0.2
+USAR_ENRUTADOR = False  # Prompts difíciles al modelo grande (ollama pull llama3.2:3b)
+RUTA_LOG_RUTAS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "routing_log")
+RUTA_TRAZAS = None  # Ruta .jsonl para exportar una traza por petición (None = desactivado)
+ESPECULACION = False  # Lanza Ollama en paralelo mientras busca en la base de datos
+ESPECULACION_RETARDO = 0.05  # Segundos de búsqueda antes de lanzarlo (ver speculation_report)
+ESPECULACION_MAX = 2  # Generaciones especulativas simultáneas como máximo
+USAR_POOL_PROCESOS = False  # Puntúa las consultas TF-IDF en varios procesos (tablas grandes, varios núcleos)
+USAR_RERANKER = True  # Reordena los K_CANDIDATOS por cobertura de la consulta además del score TF-IDF
+RUTA_UMBRAL = os.path.join(os.path.dirname(os.path.abspath(__file__)), "umbral_calibrado.json")
+RUTA_LOG_RECUPERACION = os.path.join(os.path.dirname(os.path.abspath(__file__)), "retrieval_log")
+REGISTRAR_RECUPERACION = True  # Decisiones y correcciones para calibrar (python retrieval_ranking.py)
+MODO_AUMENTADO = True  # Sin acierto en la base, Ollama recibe los candidatos como contexto
+REGISTRAR_INTERACCIONES = True  # Nivel, score y latencias por petición (python interaction_log.py)
+RUTA_INTERACCIONES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "interactions")
+PROMOCIONAR_RESPUESTAS = True  # Respuestas frecuentes de Ollama propuestas para knowledge (ver knowledge_promotion.py)
+RUTA_COLA_PROMOCION = os.path.join(os.path.dirname(os.path.abspath(__file__)), "promotion_queue.jsonl")
+
+PROMPT_SISTEMA = 'Eres un asistente útil y conciso. Responde máximo 2 párrafos en español. Sé directo y claro. Responde en 100 palabras máximo.'
+OPCIONES_OLLAMA = {
+    'temperature': 0.3,  # Menos creatividad = más rápido
+    'num_predict': 120,  # Limitar longitud
+}
+PROMPT_AUMENTADO = 'Responde en español en 2 o 3 frases usando la información dada. Si no basta, dilo brevemente.'
+OPCIONES_AUMENTADAS = {'num_predict': 80}  # Con contexto basta una respuesta más corta
+
+# -----------------------------
+# BASE DE DATOS (POOL DE CONEXIONES)
+# -----------------------------
+repository = create_repository()
+
+def get_all_data():
+    return repository.get_all()
+
+def count_knowledge():
+    return repository.count()
+
+def iter_knowledge_questions(after_id=0):
+    """(id, pregunta) de toda la tabla (o de los ids posteriores a `after_id`), leída por lotes"""
+    for batch in repository.iter_questions(LOTE_LECTURA, after_id):
+        yield from batch
+
+def insert_new_qa(question, answer):
+    return repository.insert(question, answer)
+
+# -----------------------------
+# SISTEMA DE CACHÉ PARA RESPUESTAS RÁPIDAS
+# -----------------------------
+respuestas_cache = ResponseCache()
+
+def get_cached_response(user_input):
+    """Retorna respuesta del cache si existe"""
+    return respuestas_cache.get(user_input)
+
+def add_to_cache(user_input, response):
+    """Agrega respuesta al cache"""
+    respuestas_cache.set(user_input, response)
+
+# -----------------------------
+# RESPUESTAS INSTANTÁNEAS MEJORADAS
+# -----------------------------
+instant_matcher = InstantMatcher.from_file(RUTA_RESPUESTAS_INSTANTANEAS)
+
+def get_instant_response(prompt):
+    """Respuestas locales ultra-rápidas"""
+    return instant_matcher.match(prompt)
+
+# -----------------------------
+# CHATBOT CON BASE DE DATOS OPTIMIZADO
+# -----------------------------
+knowledge_index = None
+
+def load_knowledge_index():
+    """Carga el índice desde disco o lo construye recorriendo la tabla por lotes"""
+    global knowledge_index
+    index = None
+    if os.path.exists(os.path.join(RUTA_INDICE, "manifest.json")):
+        try:
+            loaded = ShardedKnowledgeIndex.load(repository, RUTA_INDICE)
+            if len(loaded) != count_knowledge():
+                # Filas nuevas (importación, otro proceso): solo se reindexa el último fragmento
+                with span("db.index_refresh"):
+                    loaded.refresh()
+            if len(loaded) == count_knowledge():  # Si no, se borraron filas de fragmentos cerrados
+                index = loaded
+        except Exception as e:
+            print(f"Error al cargar índice: {e}")
+
+    if index is None:
+        with span("db.index_build"):
+            index = ShardedKnowledgeIndex(repository, RUTA_INDICE).build()
+    if USAR_POOL_PROCESOS:
+        start_retrieval_pool(index)
+    knowledge_index = index
+    if USAR_EMBEDDINGS:
+        load_embedding_index()
+    return knowledge_index
+
+retrieval_pool = None
+
+def start_retrieval_pool(index, **kwargs):
+    """Reparte la puntuación de `index` entre varios procesos"""
+    global retrieval_pool
+    stop_retrieval_pool()
+    retrieval_pool = RetrievalPool(index, **kwargs)
+    index.scorer = retrieval_pool
+    return retrieval_pool
+
+def stop_retrieval_pool():
+    global retrieval_pool
+    if retrieval_pool is not None:
+        retrieval_pool.index.scorer = None
+        retrieval_pool.close()
+        retrieval_pool = None
+
+embedding_index = None
+
+def load_embedding_index():
+    """Carga el índice de embeddings y calcula solo las filas nuevas (o lo construye entero)"""
+    global embedding_index
+    try:
+        index = None
+        if os.path.exists(f"{RUTA_INDICE_EMBEDDINGS}.json"):
+            try:
+                index = EmbeddingIndex.load(RUTA_INDICE_EMBEDDINGS)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Índice de embeddings antiguo o dañado, se recalcula: {e}")
+        if index is not None and len(index) <= count_knowledge():
+            # Filas insertadas desde el último guardado (importaciones, otro proceso)
+            added = index.extend(iter_knowledge_questions(after_id=index.last_id()))
+            if index.needs_compaction():
+                index.compact().save(RUTA_INDICE_EMBEDDINGS)
+            elif added:
+                index.save_tail(RUTA_INDICE_EMBEDDINGS)
+            embedding_index = index
+            return embedding_index
+        print("Calculando embeddings de la base de conocimiento...")
+        embedding_index = EmbeddingIndex().build(iter_knowledge_questions())
+        embedding_index.save(RUTA_INDICE_EMBEDDINGS)
+    except Exception as e:
+        print(f"Error en índice de embeddings: {e}")
+        embedding_index = None
+    return embedding_index
+
+def add_embeddings(rows):
+    """Calcula los embeddings de las filas (id, pregunta) aprendidas y guarda la cola"""
+    if embedding_index is None:
+        return
+    try:
+        embedding_index.extend(rows)
+        embedding_index.save_tail(RUTA_INDICE_EMBEDDINGS)
+    except Exception as e:
+        print(f"Error al añadir embedding: {e}")
+
+_learn_lock = threading.Lock()  # Inserción y alta en el índice sin intercalarse
+
+def learn_new_qa(question, answer):
+    """Guarda el par en la base de datos y lo añade al índice en memoria"""
+    with _learn_lock:
+        row_id = insert_new_qa(question, answer)
+        if row_id and knowledge_index is not None:
+            knowledge_index.add(row_id, question)
+    if not row_id:
+        return False
+    if retrieval_log:
+        retrieval_log.outcome(question, answer)
+    if interaction_log:
+        interaction_log.record_correction(question, answer)
+    if promoter:
+        promoter.forget(question)
+    add_embeddings([(row_id, question)])
+    respuestas_cache.clear()  # Las respuestas cacheadas pueden haber cambiado
+    return True
+
+def learn_many_qa(pairs):
+    """Inserta los pares en una transacción y los añade al índice; retorna cuántos"""
+    with _learn_lock:
+        index = knowledge_index if knowledge_index is not None else load_knowledge_index()
+        last_id = index.last_id()
+        inserted = repository.insert_many(pairs)
+        rows = list(iter_knowledge_questions(after_id=last_id)) if inserted else []
+        for row_id, question in rows:
+            index.add(row_id, question)
+    if inserted:
+        add_embeddings(rows)
+        respuestas_cache.clear()
+    return inserted
+
+umbral_recuperacion = load_calibration(RUTA_UMBRAL, UMBRAL_SIMILITUD)
+retrieval_log = None    # Los registros en segundo plano los arranca start_logging()
+interaction_log = None  # desde la GUI o el servidor HTTP, nunca al importar
+
+def start_logging():
+    """Arranca los hilos de registro de recuperación, interacciones y rutas"""
+    global retrieval_log, interaction_log
+    if REGISTRAR_RECUPERACION and retrieval_log is None:
+        retrieval_log = RetrievalLog(RUTA_LOG_RECUPERACION)
+    if REGISTRAR_INTERACCIONES and interaction_log is None:
+        interaction_log = InteractionLog(RUTA_INTERACCIONES)
+    if router is not None and router.log is None:
+        router.log = SegmentWriter(RUTA_LOG_RUTAS, "routing")
+
+promoter = None  # Lo arranca start_promoter(); el benchmark y las herramientas no promocionan
+
+def start_promoter():
+    """Arranca la promoción de respuestas frecuentes de Ollama a knowledge"""
+    global promoter
+    if PROMOCIONAR_RESPUESTAS and promoter is None:
+        promoter = AnswerPromoter(learn_many_qa, RUTA_COLA_PROMOCION)
+    return promoter
+
+def stop_promoter():
+    """Escribe las aprobadas pendientes y detiene el hilo de promoción"""
+    global promoter
+    if promoter is not None:
+        promoter.close()
+        promoter = None
+
+def get_db_candidates(user_input, k=K_CANDIDATOS):
+    """Top-k de la base de conocimiento, re-ordenado si USAR_RERANKER"""
+    candidates = [Candidate(*hit) for hit in knowledge_index.top_k(user_input, k)]
+    return rerank(user_input, candidates) if USAR_RERANKER else candidates
+
+def get_db_response(user_input):
+    """Búsqueda en base de datos con cache: (respuesta, score, contexto).
+
+    Sin respuesta, `contexto` son los candidatos más parecidos como pares
+    (pregunta, respuesta) para Ollama, sin repetir la búsqueda.
+    """
+    # Primero verificar cache
+    with span("db.cache"):
+        cached = get_cached_response(user_input)
+    if cached:
+        return cached, 1.0, []
+    
+    index = knowledge_index if knowledge_index is not None else load_knowledge_index()
+    if not len(index):
+        return None, 0.0, []
+
+    try:
+        with span("db.tfidf"):
+            candidates = get_db_candidates(user_input)
+            best, gap = decide(candidates, umbral_recuperacion)
+        if retrieval_log:
+            retrieval_log.record(user_input, candidates, best, gap)
+        response = best.answer if best else None
+        score = candidates[0].score if candidates else 0.0
+        if not response and embedding_index is not None:
+            # Nivel semántico: parafraseos que TF-IDF no detecta
+            with span("db.embeddings"):
+                row_id, score = embedding_index.query(user_input)
+            row = index.get_rows([row_id]).get(row_id) if row_id is not None else None
+            response = row[1] if row else None
+        if response:
+            add_to_cache(user_input, response)  # Cachear resultado
+            return response, score, []
+        context = [
+            (candidate.question, candidate.answer)
+            for candidate in candidates if candidate.score > CONTEXTO_SCORE_MIN
+        ][:CONTEXTO_FILAS]
+        return None, score, context
+    except Exception as e:
+        print(f"Error en procesamiento de texto: {e}")
+        return None, 0.0, []
+
+# -----------------------------
+# OLLAMA OPTIMIZADO CON TIMEOUT
+# -----------------------------
+generation_cache = GenerationCache(RUTA_CACHE_GENERACIONES) if USAR_CACHE_GENERACIONES else None
+
+def build_messages(prompt):
+    return [
+        {
+            'role': 'system', 
+            'content': PROMPT_SISTEMA
+        },
+        {
+            'role': 'user', 
+            'content': prompt
+        }
+    ]
+
+def build_augmented_messages(prompt, context):
+    facts = "\n".join(f"- {question}: {answer}" for question, answer in context)
+    return [
+        {'role': 'system', 'content': PROMPT_AUMENTADO},
+        {'role': 'user', 'content': f"Información:\n{facts}\n\nPregunta: {prompt}"},
+    ]
+
+def ollama_fallback(prompt):
+    return f"💡 Basándome en tu pregunta sobre '{prompt}', es un tema interesante. ¿Te gustaría que aprenda más sobre esto?"
+
+# -----------------------------
+# MOTOR ASÍNCRONO (OLLAMA ASYNCCLIENT)
+# -----------------------------
+metrics.trace_path = RUTA_TRAZAS
+
+model_manager = ModelManager(MODELO_OLLAMA, KEEP_ALIVE)
+
+conversations = ConversationStore(PROMPT_SISTEMA, CONTEXTO_MAX_TOKENS) if USAR_MEMORIA else None
+
+router = ModelRouter(
+    routes={**RUTAS, "rapido": {"model": MODELO_OLLAMA, "options": OPCIONES_OLLAMA}},
+    log=None,  # Lo asigna start_logging()
+) if USAR_ENRUTADOR else None
+
+def create_engine(**kwargs):
+    """Motor asíncrono con la jerarquía instantáneo → caché → base de datos → Ollama"""
+    client = kwargs.pop("client", None) or ollama.AsyncClient()
+    if USAR_PLANIFICADOR:
+        client = LLMScheduler(client)
+    config = {
+        "client": client,
+        "instant": get_instant_response,
+        "retrieve": get_db_response,
+        "model": MODELO_OLLAMA,
+        "build_messages": build_messages,
+        "options": OPCIONES_OLLAMA,
+        "system_prompt": PROMPT_SISTEMA,
+        "fallback": ollama_fallback,
+        "generation_cache": generation_cache,
+        "keep_alive": KEEP_ALIVE,
+        "speculative": ESPECULACION,
+        "speculation_delay": ESPECULACION_RETARDO,
+        "max_speculative": ESPECULACION_MAX,
+        "conversations": conversations,
+        "router": router,
+        "augment": build_augmented_messages if MODO_AUMENTADO else None,
+        "augment_options": OPCIONES_AUMENTADAS,
+        "interaction_log": interaction_log,
+        "promoter": promoter,
+    }
+    config.update(kwargs)
+    return ResponseEngine(**config)
@@ -0,0 +1,139 @@
+import re
+import threading
+from collections import OrderedDict, deque
+
+from text_normalization import normalize_text
+
+# -----------------------------
+# MEMORIA DE CONVERSACIÓN CON PRESUPUESTO DE TOKENS
+# -----------------------------
+CONTEXTO_MAX_TOKENS = 1024   # Presupuesto para resumen + turnos recientes
+RESUMEN_MAX_TOKENS = 256
+TURNOS_RECIENTES_MIN = 2     # Turnos que nunca se compactan
+MAX_SESIONES = 1000
+# Un prompt que cumple alguna de estas condiciones se envía con el historial;
+# el resto va solo y puede servirlo la caché de generaciones
+SEGUIMIENTO_MAX_PALABRAS = 3  # "¿y en verano?", "explícalo mejor"
+PALABRAS_SEGUIMIENTO = frozenset("""
+eso esto ese esa esos esas estos estas ello ella ellas ellos anterior dicho dicha
+mismo misma tambien entonces otro otra otros otras ahi alli
+""".split())
+INICIOS_SEGUIMIENTO = ("y ", "pero ", "o sea", "entonces ")
+
+_FRASE = re.compile(r"(?<=[.!?])\s+")
+
+
+def estimate_tokens(text):
+    """Aproximación barata: ~4 caracteres por token en español"""
+    return max(1, len(text) // 4) if text else 0
+
+
+def first_sentence(text):
+    return _FRASE.split(text.strip(), 1)[0]
+
+
+def is_follow_up(prompt):
+    """Heurística: el prompt se apoya en turnos anteriores (muy corto, referencias, "y ...")"""
+    text = normalize_text(prompt)
+    words = text.split()
+    return (len(words) <= SEGUIMIENTO_MAX_PALABRAS
+            or text.startswith(INICIOS_SEGUIMIENTO)
+            or any(word in PALABRAS_SEGUIMIENTO for word in words))
+
+
+def extractive_summary(previous, turns, max_tokens=RESUMEN_MAX_TOKENS):
+    """Resumen sin LLM: primera frase de cada intercambio, recortado al presupuesto"""
+    lines = [previous] if previous else []
+    lines += [f"- Usuario: {first_sentence(user)} → Asistente: {first_sentence(assistant)}" for user, assistant in turns]
+    summary = "\n".join(lines)
+    max_chars = max_tokens * 4
+    return summary[-max_chars:] if len(summary) > max_chars else summary
+
+
+class Conversation:
+    """Estado de una sesión: resumen acumulado y turnos recientes.
+
+    Los mensajes se construyen siempre en el mismo orden (sistema, resumen,
+    turnos) y solo crecen por el final, de modo que el prefijo se repite de una
+    petición a otra y Ollama puede reutilizar su caché de prompt. El contexto
+    recuperado de `knowledge` va en el último mensaje para no romper ese prefijo.
+    """
+
+    def __init__(self, system_prompt, max_tokens=CONTEXTO_MAX_TOKENS):
+        self.system_prompt = system_prompt
+        self.max_tokens = max_tokens
+        self.summary = ""
+        self.turns = []
+        self.turn_stats = deque(maxlen=100)
+        self._lock = threading.Lock()
+
+    @property
+    def has_history(self):
+        return bool(self.summary or self.turns)
+
+    def history_tokens(self):
+        return estimate_tokens(self.summary) + sum(
+            estimate_tokens(user) + estimate_tokens(assistant) for user, assistant in self.turns
+        )
+
+    def build_messages(self, prompt, context=None, history=True):
+        with self._lock:
+            messages = [{'role': 'system', 'content': self.system_prompt}]
+            if history and self.summary:
+                messages.append({'role': 'system', 'content': f"Resumen de la conversación:\n{self.summary}"})
+            for user, assistant in self.turns if history else ():
+                messages.append({'role': 'user', 'content': user})
+                messages.append({'role': 'assistant', 'content': assistant})
+
+        content = prompt
+        if context:
+            facts = "\n".join(f"- {question}: {answer}" for question, answer in context)
+            content = f"Información relacionada de la base de conocimiento:\n{facts}\n\nPregunta: {prompt}"
+        messages.append({'role': 'user', 'content': content})
+        return messages
+
+    def add_turn(self, user, assistant, prompt_tokens=None, latency=None):
+        with self._lock:
+            self.turns.append((user, assistant))
+            if prompt_tokens is not None or latency is not None:
+                self.turn_stats.append({"prompt_tokens": prompt_tokens, "latency": latency})
+
+    def needs_compaction(self):
+        with self._lock:
+            return len(self.turns) > TURNOS_RECIENTES_MIN and self.history_tokens() > self.max_tokens
+
+    def compact(self, summarize=extractive_summary):
+        """Pliega los turnos más antiguos en el resumen hasta entrar en el presupuesto"""
+        with self._lock:
+            old = []
+            while len(self.turns) > TURNOS_RECIENTES_MIN and self.history_tokens() > self.max_tokens:
+                old.append(self.turns.pop(0))
+            if old:
+                self.summary = summarize(self.summary, old)
+
+
+class ConversationStore:
+    """Conversaciones por sesión, con expulsión LRU de las sesiones inactivas"""
+
+    def __init__(self, system_prompt, max_tokens=CONTEXTO_MAX_TOKENS, max_sessions=MAX_SESIONES):
+        self.system_prompt = system_prompt
+        self.max_tokens = max_tokens
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        with self._lock:
+            conversation = self._sessions.get(session_id)
+            if conversation is None:
+                conversation = Conversation(self.system_prompt, self.max_tokens)
+                self._sessions[session_id] = conversation
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(session_id)
+            return conversation
+
+    def reset(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
@@ -0,0 +1,315 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import ollama
+
+# -----------------------------
+# ÍNDICE SEMÁNTICO (EMBEDDINGS DENSOS)
+# -----------------------------
+MODELO_EMBEDDINGS = "nomic-embed-text"  # ollama pull nomic-embed-text
+UMBRAL_EMBEDDINGS = 0.75
+ANN_MIN_FILAS = 5000     # Por debajo, búsqueda exacta (más rápida que IVF en tablas pequeñas)
+IVF_NPROBE = 8           # Listas invertidas que se revisan por consulta
+LOTE_EMBEDDINGS = 64
+COLA_MAX_FILAS = 2000    # Filas añadidas (recorrido exacto) antes de integrarlas en la matriz
+
+
+def embed_texts(texts, model=MODELO_EMBEDDINGS, client=None, batch_size=LOTE_EMBEDDINGS):
+    """Embeddings normalizados (float32) usando el modelo local de Ollama"""
+    embed = (client or ollama).embed
+    vectors = []
+    for start in range(0, len(texts), batch_size):
+        response = embed(model=model, input=texts[start:start + batch_size])
+        vectors.extend(response['embeddings'])
+    return _normalize(np.asarray(vectors, dtype=np.float32))
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _kmeans(vectors, n_clusters, iterations=10, seed=0):
+    """K-means esférico sencillo sobre una muestra (coseno, vectores normalizados)"""
+    rng = np.random.default_rng(seed)
+    sample = vectors[rng.choice(len(vectors), size=min(len(vectors), n_clusters * 64), replace=False)]
+    centroids = sample[rng.choice(len(sample), size=n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = (sample @ centroids.T).argmax(axis=1)
+        for c in range(n_clusters):
+            members = sample[assignment == c]
+            if len(members):
+                centroids[c] = members.sum(axis=0)
+        centroids = _normalize(centroids)
+    return centroids
+
+
+def _save_array(path, array):
+    """Escribe en un temporal y lo renombra: quien tenga el archivo en mmap sigue leyendo el anterior"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+def _top_k(scores, k):
+    """Índices de los k mayores puntajes, ordenados (selección parcial)"""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+class EmbeddingIndex:
+    """Matriz float32 de embeddings (memory-mapped) con índice IVF opcional.
+
+    Las tablas con menos de ANN_MIN_FILAS filas se buscan de forma exacta.
+    Las preguntas añadidas después de construir el índice se guardan en una
+    cola que siempre se recorre de forma exacta y se persiste aparte
+    (`save_tail`); `compact` la integra en la matriz. Solo se guardan los ids
+    de las filas: las respuestas se piden por clave primaria.
+    """
+
+    def __init__(self, model=MODELO_EMBEDDINGS, client=None, nprobe=IVF_NPROBE):
+        self.model = model
+        self.client = client
+        self.nprobe = nprobe
+        self.vectors = None
+        self.ids = np.empty(0, dtype=np.int64)  # id de knowledge de cada fila de `vectors`
+        self.centroids = None
+        self.list_order = None    # posiciones ordenadas por lista invertida
+        self.list_offsets = None  # inicio de cada lista dentro de list_order
+        self._extra_vectors = []
+        self._extra_ids = []
+
+    def __len__(self):
+        return len(self.ids) + len(self._extra_ids)
+
+    def _embed_rows(self, rows):
+        """(ids, vectores) de las filas (id, pregunta), con los embeddings calculados por lotes"""
+        ids, blocks, chunk = [], [], []
+        for row_id, question in rows:
+            ids.append(row_id)
+            chunk.append(question)
+            if len(chunk) >= LOTE_EMBEDDINGS:
+                blocks.append(embed_texts(chunk, self.model, self.client))
+                chunk = []
+        if chunk:
+            blocks.append(embed_texts(chunk, self.model, self.client))
+        return np.asarray(ids, dtype=np.int64), np.vstack(blocks) if blocks else None
+
+    def build(self, rows, ann_min_rows=ANN_MIN_FILAS):
+        """Calcula por lotes los embeddings de las filas (id, pregunta) y, si procede, el IVF"""
+        self.ids, self.vectors = self._embed_rows(rows)
+        self._extra_vectors = []
+        self._extra_ids = []
+        self._index_vectors(ann_min_rows)
+        return self
+
+    def _index_vectors(self, ann_min_rows):
+        if self.vectors is not None and len(self.ids) >= ann_min_rows:
+            self._build_ivf()
+        else:
+            self.centroids = self.list_order = self.list_offsets = None
+
+    def _build_ivf(self):
+        n_lists = max(1, int(np.sqrt(len(self.vectors))))
+        self.centroids = _kmeans(self.vectors, n_lists)
+        assignment = np.empty(len(self.vectors), dtype=np.int32)
+        for start in range(0, len(self.vectors), 65536):
+            block = self.vectors[start:start + 65536]
+            assignment[start:start + len(block)] = (block @ self.centroids.T).argmax(axis=1)
+        self.list_order = np.argsort(assignment, kind="stable").astype(np.int64)
+        self.list_offsets = np.searchsorted(assignment[self.list_order], np.arange(n_lists + 1))
+
+    def add(self, row_id, question):
+        """Añade una pregunta aprendida sin reconstruir la matriz"""
+        self._extra_vectors.append(embed_texts([question], self.model, self.client)[0])
+        self._extra_ids.append(row_id)
+
+    def extend(self, rows):
+        """Añade a la cola las filas (id, pregunta) nuevas; retorna cuántas"""
+        ids, vectors = self._embed_rows(rows)
+        if vectors is not None:
+            self._extra_vectors.extend(vectors)
+            self._extra_ids.extend(int(row_id) for row_id in ids)
+        return len(ids)
+
+    def last_id(self):
+        """Mayor id con embedding (0 si está vacío); las filas posteriores faltan por calcular"""
+        return max([int(self.ids.max()) if len(self.ids) else 0, *self._extra_ids])
+
+    def needs_compaction(self, max_tail=COLA_MAX_FILAS):
+        return len(self._extra_ids) > max_tail
+
+    def compact(self, ann_min_rows=ANN_MIN_FILAS):
+        """Integra la cola en la matriz y recalcula el IVF (sin volver a calcular embeddings)"""
+        if not self._extra_ids:
+            return self
+        extra = np.asarray(self._extra_vectors, dtype=np.float32)
+        self.vectors = extra if self.vectors is None else np.vstack([self.vectors, extra])
+        self.ids = np.concatenate([self.ids, np.asarray(self._extra_ids, dtype=np.int64)])
+        self._extra_vectors = []
+        self._extra_ids = []
+        self._index_vectors(ann_min_rows)
+        return self
+
+    def row_id(self, position):
+        """Id de knowledge de una posición devuelta por `search`"""
+        base = len(self.ids)
+        return int(self.ids[position]) if position < base else self._extra_ids[position - base]
+
+    def search(self, query_vector, k=5):
+        """Retorna (posiciones, puntajes) de las k preguntas más similares"""
+        ids = []
+        scores = []
+        if self.vectors is not None:
+            if self.centroids is None:
+                candidate_ids = None
+                candidate_scores = self.vectors @ query_vector
+            else:
+                lists = _top_k(self.centroids @ query_vector, self.nprobe)
+                candidate_ids = np.concatenate([
+                    self.list_order[self.list_offsets[c]:self.list_offsets[c + 1]] for c in lists
+                ])
+                candidate_scores = self.vectors[candidate_ids] @ query_vector
+            top = _top_k(candidate_scores, k)
+            ids.extend(top if candidate_ids is None else candidate_ids[top])
+            scores.extend(candidate_scores[top])
+
+        if self._extra_vectors:
+            base = 0 if self.vectors is None else len(self.vectors)
+            extra_scores = np.asarray(self._extra_vectors) @ query_vector
+            ids.extend(base + np.arange(len(extra_scores)))
+            scores.extend(extra_scores)
+
+        ids = np.asarray(ids, dtype=np.int64)
+        scores = np.asarray(scores, dtype=np.float32)
+        top = _top_k(scores, k)
+        return ids[top], scores[top]
+
+    def query(self, user_input, threshold=UMBRAL_EMBEDDINGS):
+        """Retorna (id de knowledge, score); el id es None si no supera el umbral"""
+        if not len(self):
+            return None, 0.0
+        positions, scores = self.search(embed_texts([user_input], self.model, self.client)[0], k=1)
+        if len(positions) and scores[0] > threshold:
+            return self.row_id(positions[0]), float(scores[0])
+        return None, float(scores[0]) if len(scores) else 0.0
+
+    def save(self, path):
+        """Guarda vectores (.npy), ids (.ids.npy), IVF (.ivf.npz), cola (.tail.npz) y metadatos (.json)
+        con el prefijo dado"""
+        _save_array(f"{path}.npy", self.vectors if self.vectors is not None else np.empty((0, 0), np.float32))
+        _save_array(f"{path}.ids.npy", self.ids)
+        if self.centroids is not None:
+            np.savez(f"{path}.ivf.npz", centroids=self.centroids,
+                     list_order=self.list_order, list_offsets=self.list_offsets)
+        elif os.path.exists(f"{path}.ivf.npz"):
+            os.remove(f"{path}.ivf.npz")
+        self.save_tail(path)
+        with open(f"{path}.json", "w", encoding="utf-8") as f:
+            json.dump({"model": self.model}, f, ensure_ascii=False)
+
+    def save_tail(self, path):
+        """Guarda solo la cola de filas añadidas, sin reescribir la matriz"""
+        tail_path = f"{path}.tail.npz"
+        if not self._extra_ids:
+            if os.path.exists(tail_path):
+                os.remove(tail_path)
+            return
+        tmp_path = f"{tail_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, vectors=np.asarray(self._extra_vectors, dtype=np.float32),
+                     ids=np.asarray(self._extra_ids, dtype=np.int64))
+        os.replace(tmp_path, tail_path)
+
+    @classmethod
+    def load(cls, path, client=None, nprobe=IVF_NPROBE):
+        """Carga el índice; la matriz se mapea en memoria sin copiarla"""
+        with open(f"{path}.json", encoding="utf-8") as f:
+            meta = json.load(f)
+        index = cls(meta["model"], client, nprobe)
+        index.ids = np.load(f"{path}.ids.npy", mmap_mode="r")
+        vectors = np.load(f"{path}.npy", mmap_mode="r")
+        index.vectors = vectors if vectors.size else None
+        if os.path.exists(f"{path}.ivf.npz"):
+            ivf = np.load(f"{path}.ivf.npz")
+            index.centroids = ivf["centroids"]
+            index.list_order = ivf["list_order"]
+            index.list_offsets = ivf["list_offsets"]
+        if os.path.exists(f"{path}.tail.npz"):
+            tail = np.load(f"{path}.tail.npz")
+            index._extra_vectors = list(tail["vectors"])
+            index._extra_ids = tail["ids"].tolist()
+        return index
+
+
+# -----------------------------
+# EVALUACIÓN FRENTE A TF-IDF
+# -----------------------------
+def evaluate(labeled_queries, tfidf_index, embedding_index, k=5):
+    """Recall@k y latencia por consulta de ambos índices.
+
+    `labeled_queries` es una lista de (consulta, pregunta correcta); las
+    preguntas de los aciertos se resuelven por id con `tfidf_index.get_rows`.
+    """
+
+    def embedding_search(query):
+        positions, _ = embedding_index.search(embed_texts([query], embedding_index.model, embedding_index.client)[0], k)
+        rows = tfidf_index.get_rows([embedding_index.row_id(p) for p in positions])
+        return [question for question, _ in rows.values()]
+
+    report = {}
+    for name, search in (
+        ("tfidf", lambda q: [question for question, _, _ in tfidf_index.top_k(q, k)]),
+        ("embeddings", embedding_search),
+    ):
+        hits = 0
+        latencies = []
+        for query, expected in labeled_queries:
+            start = time.perf_counter()
+            found = search(query)
+            latencies.append(time.perf_counter() - start)
+            hits += int(expected in found)
+        latencies.sort()
+        report[name] = {
+            f"recall@{k}": hits / len(labeled_queries) if labeled_queries else 0.0,
+            "p50_ms": 1000 * latencies[len(latencies) // 2] if latencies else 0.0,
+            "p95_ms": 1000 * latencies[int(len(latencies) * 0.95)] if latencies else 0.0,
+        }
+    return report
+
+
+def main():
+    from chatbot_core import RUTA_INDICE_EMBEDDINGS, iter_knowledge_questions, load_knowledge_index
+
+    parser = argparse.ArgumentParser(description="Construye o evalúa el índice de embeddings")
+    parser.add_argument("--build", action="store_true", help="Calcula los embeddings de toda la tabla knowledge")
+    parser.add_argument("--eval", metavar="JSONL", help='Consultas etiquetadas: {"query": ..., "question": ...}')
+    parser.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.build:
+        start = time.perf_counter()
+        index = EmbeddingIndex().build(iter_knowledge_questions())
+        index.save(RUTA_INDICE_EMBEDDINGS)
+        print(f"{len(index)} preguntas indexadas en {time.perf_counter() - start:.1f}s")
+
+    if args.eval:
+        known = {question for _, question in iter_knowledge_questions()}
+        with open(args.eval, encoding="utf-8") as f:
+            items = [json.loads(line) for line in f if line.strip()]
+        labeled = [(item["query"], item["question"]) for item in items if item["question"] in known]
+        del known
+        report = evaluate(labeled, load_knowledge_index(), EmbeddingIndex.load(RUTA_INDICE_EMBEDDINGS), args.k)
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
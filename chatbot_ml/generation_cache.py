@@ -0,0 +1,110 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from text_normalization import normalize_text
+
+# -----------------------------
+# CACHÉ EN DISCO DE GENERACIONES OLLAMA
+# -----------------------------
+GEN_CACHE_MAX_BYTES = 64 * 1024 * 1024
+VERSION_CLAVE = 2  # Cambia al cambiar la normalización del prompt: las claves antiguas dejan de coincidir
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS generations (
+    key TEXT PRIMARY KEY,
+    response TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_access REAL NOT NULL
+)
+"""
+
+
+def generation_key(model, system_prompt, options, prompt):
+    """Clave estable para (modelo, prompt de sistema, opciones, prompt normalizado)"""
+    payload = json.dumps(
+        [VERSION_CLAVE, model, system_prompt, options or {}, normalize_text(prompt)],
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class GenerationCache:
+    """Caché SQLite persistente entre reinicios con expulsión por tamaño (LRU)"""
+
+    def __init__(self, path, max_bytes=GEN_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(ESQUEMA)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, model, system_prompt, options, prompt):
+        key = generation_key(model, system_prompt, options, prompt)
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM generations WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE generations SET last_access = ? WHERE key = ?", (time.time(), key))
+            self.hits += 1
+            return row[0]
+
+    def set(self, model, system_prompt, options, prompt, response):
+        key = generation_key(model, system_prompt, options, prompt)
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO generations (key, response, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, response, size, time.time()),
+            )
+            self._evict()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM generations").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Borra las menos usadas hasta volver por debajo del límite
+        freed = 0
+        victims = []
+        for key, size in self._conn.execute("SELECT key, size FROM generations ORDER BY last_access"):
+            if total - freed <= self.max_bytes:
+                break
+            victims.append((key,))
+            freed += size
+        self._conn.executemany("DELETE FROM generations WHERE key = ?", victims)
+        self.evictions += len(victims)
+
+    def stats(self):
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM generations"
+            ).fetchone()
+            total = self.hits + self.misses
+            return {
+                "entries": entries,
+                "bytes": size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+    def report(self):
+        s = self.stats()
+        return (
+            f"Caché de generaciones: {s['hit_rate']:.1%} aciertos "
+            f"({s['hits']}/{s['hits'] + s['misses']}), {s['entries']} entradas, "
+            f"{s['bytes'] / 1024:.1f} KiB, {s['evictions']} expulsiones"
+        )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
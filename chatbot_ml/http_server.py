@@ -0,0 +1,328 @@
+import argparse
+import asyncio
+import json
+import signal
+
+from chatbot_core import ESPECULACION_MAX, ESPECULACION_RETARDO, create_engine, load_knowledge_index, model_manager, start_logging, start_promoter, stop_promoter
+from metrics import metrics
+from ollama_stub import StubAsyncClient
+
+# -----------------------------
+# SERVIDOR HTTP SIN INTERFAZ GRÁFICA
+# -----------------------------
+WORKERS = 4          # Peticiones atendidas a la vez
+MAX_COLA = 32        # Peticiones en espera antes de responder 429
+DRENAJE_TIMEOUT = 30  # segundos para terminar las peticiones en curso al apagar
+MAX_CUERPO = 64 * 1024
+
+ESTADOS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    429: "Too Many Requests",
+    503: "Service Unavailable",
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class ChatServer:
+    """Expone la jerarquía instantáneo → caché → TF-IDF → Ollama por HTTP.
+
+    POST /chat          -> JSON {"response", "tier", "time"}; "session" en el cuerpo activa la memoria
+    POST /chat/stream   -> server-sent events con los fragmentos y un evento "done"
+    GET  /health        -> estado, peticiones en curso y en cola (y especulación, si está activa)
+    GET  /metrics       -> histogramas por nivel en formato Prometheus
+    """
+
+    def __init__(self, engine, host="127.0.0.1", port=8000, workers=WORKERS,
+                 max_queue=MAX_COLA, drain_timeout=DRENAJE_TIMEOUT, model_manager=None):
+        self.engine = engine
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.max_queue = max_queue
+        self.drain_timeout = drain_timeout
+        self.model_manager = model_manager
+        self._semaphore = asyncio.Semaphore(workers)
+        self._admitted = 0
+        self._active = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._draining = False
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        print(f"Servidor escuchando en http://{self.host}:{self.port}")
+
+    async def shutdown(self):
+        """Deja de aceptar conexiones y espera a que terminen las peticiones admitidas"""
+        self._draining = True
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+        try:
+            await asyncio.wait_for(self._idle.wait(), self.drain_timeout)
+        except asyncio.TimeoutError:
+            print(f"Drenaje incompleto: {self._admitted} peticiones sin terminar")
+
+    # -----------------------------
+    # HTTP MÍNIMO
+    # -----------------------------
+    async def _read_request(self, reader):
+        request_line = (await reader.readline()).decode("latin-1").strip()
+        if not request_line:
+            return None
+        try:
+            method, path, _ = request_line.split(" ", 2)
+        except ValueError:
+            raise HTTPError(400, "Línea de petición inválida")
+
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get("content-length") or 0)
+        except ValueError:
+            raise HTTPError(400, "Content-Length inválido")
+        if length < 0:
+            raise HTTPError(400, "Content-Length inválido")
+        if length > MAX_CUERPO:
+            raise HTTPError(413, "Cuerpo demasiado grande")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), path.split("?", 1)[0], body
+
+    async def _send_json(self, writer, status, payload, extra_headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        headers = {
+            "Content-Type": "application/json; charset=utf-8",
+            "Content-Length": str(len(body)),
+            **(extra_headers or {}),
+        }
+        self._write_head(writer, status, headers)
+        writer.write(body)
+        await writer.drain()
+
+    def _write_head(self, writer, status, headers):
+        lines = [f"HTTP/1.1 {status} {ESTADOS[status]}"]
+        lines += [f"{name}: {value}" for name, value in {**headers, "Connection": "close"}.items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+
+    async def _handle(self, reader, writer):
+        try:
+            request = await self._read_request(reader)
+            if request is None:
+                return
+            method, path, body = request
+            if path == "/metrics":
+                body = metrics.to_prometheus().encode("utf-8")
+                self._write_head(writer, 200, {
+                    "Content-Type": "text/plain; version=0.0.4; charset=utf-8",
+                    "Content-Length": str(len(body)),
+                })
+                writer.write(body)
+                await writer.drain()
+            elif path == "/health":
+                health = {
+                    "status": "draining" if self._draining else "ok",
+                    "active": self._active,
+                    "queued": self._admitted - self._active,
+                }
+                if self.model_manager:
+                    health["model"] = self.model_manager.state
+                if hasattr(self.engine.client, "metrics"):
+                    health["llm"] = self.engine.client.metrics()
+                if self.engine.speculative:
+                    health["speculation"] = self.engine.speculation_report()
+                await self._send_json(writer, 200, health)
+            elif path in ("/chat", "/chat/stream"):
+                if method != "POST":
+                    raise HTTPError(405, "Usa POST")
+                await self._admit(writer, path, self._parse_body(body))
+            else:
+                raise HTTPError(404, "Ruta no encontrada")
+        except HTTPError as e:
+            await self._send_json(writer, e.status, {"error": str(e)})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            try:
+                writer.close()
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    def _parse_body(self, body):
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            raise HTTPError(400, "JSON inválido")
+        if not isinstance(payload, dict):
+            raise HTTPError(400, "El cuerpo debe ser un objeto JSON")
+        message = str(payload.get("message", "")).strip()
+        if not message:
+            raise HTTPError(400, "Falta 'message'")
+        # Sin "session" no hay memoria: la IP la comparten clientes distintos (NAT, proxy)
+        session = payload.get("session")
+        return (str(session) if session else None), message
+
+    # -----------------------------
+    # ADMISIÓN Y CONTRAPRESIÓN
+    # -----------------------------
+    async def _admit(self, writer, path, request):
+        if self._draining:
+            raise HTTPError(503, "Servidor apagándose")
+        if self._admitted >= self.workers + self.max_queue:
+            await self._send_json(writer, 429, {"error": "Servidor saturado"}, {"Retry-After": "1"})
+            return
+
+        self._admitted += 1
+        self._idle.clear()
+        try:
+            async with self._semaphore:
+                self._active += 1
+                try:
+                    if path == "/chat":
+                        await self._chat(writer, *request)
+                    else:
+                        await self._chat_stream(writer, *request)
+                finally:
+                    self._active -= 1
+        finally:
+            self._admitted -= 1
+            if not self._admitted:
+                self._idle.set()
+
+    async def _chat(self, writer, session, message):
+        result = await self.engine.run(session, message)
+        await self._send_json(writer, 200, {
+            "response": result.text,
+            "tier": result.tier,
+            "time": round(result.total_time, 4),
+            "prompt_tokens": result.prompt_tokens,
+        })
+
+    async def _chat_stream(self, writer, session, message):
+        chunks = asyncio.Queue()
+        task = asyncio.ensure_future(self.engine.run(session, message, on_chunk=chunks.put_nowait))
+        self._write_head(writer, 200, {
+            "Content-Type": "text/event-stream; charset=utf-8",
+            "Cache-Control": "no-cache",
+        })
+        try:
+            while True:
+                getter = asyncio.ensure_future(chunks.get())
+                done, _ = await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+                if getter not in done:
+                    getter.cancel()
+                    break
+                await self._send_event(writer, {"chunk": getter.result()})
+
+            while not chunks.empty():
+                await self._send_event(writer, {"chunk": chunks.get_nowait()})
+
+            result = task.result()
+            if result.tier in ("instant", "db"):
+                await self._send_event(writer, {"chunk": result.text})
+            await self._send_event(writer, {
+                "tier": result.tier,
+                "first_token_time": result.first_token_time,
+                "time": round(result.total_time, 4),
+                "prompt_tokens": result.prompt_tokens,
+            }, event="done")
+        finally:
+            # Si el cliente se desconecta, se cancela la generación en curso
+            if not task.done():
+                task.cancel()
+
+    async def _send_event(self, writer, payload, event=None):
+        data = json.dumps(payload, ensure_ascii=False)
+        prefix = f"event: {event}\n" if event else ""
+        writer.write(f"{prefix}data: {data}\n\n".encode("utf-8"))
+        await writer.drain()
+
+
+# -----------------------------
+# INICIALIZACIÓN
+# -----------------------------
+async def serve(args):
+    start_logging()
+    await asyncio.to_thread(load_knowledge_index)
+
+    engine_options = {"speculation_delay": args.speculation_delay, "max_speculative": args.max_speculative}
+    manager = None
+    if not args.stub:
+        manager = model_manager
+        manager.start()  # Precarga el modelo sin retrasar el arranque
+        start_promoter()  # Las respuestas simuladas (--stub) no se promocionan
+    if args.speculative:
+        engine_options["speculative"] = True
+    if args.stub:
+        engine_options["client"] = StubAsyncClient(latency=args.stub_latency, tokens_per_second=args.stub_tps)
+        engine_options["generation_cache"] = None
+
+    server = ChatServer(
+        create_engine(**engine_options),
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        max_queue=args.max_queue,
+        drain_timeout=args.drain_timeout,
+        model_manager=manager,
+    )
+    await server.start()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows: se detiene con Ctrl+C (KeyboardInterrupt)
+
+    try:
+        await stop.wait()
+    finally:
+        print("Apagando: esperando peticiones en curso...")
+        await server.shutdown()
+        await asyncio.to_thread(stop_promoter)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chatbot sin interfaz gráfica sobre HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--max-queue", type=int, default=MAX_COLA)
+    parser.add_argument("--drain-timeout", type=float, default=DRENAJE_TIMEOUT)
+    parser.add_argument("--speculative", action="store_true", help="Lanza Ollama en paralelo con la búsqueda")
+    parser.add_argument("--speculation-delay", type=float, default=ESPECULACION_RETARDO,
+                        help="Segundos de búsqueda antes de especular")
+    parser.add_argument("--max-speculative", type=int, default=ESPECULACION_MAX,
+                        help="Generaciones especulativas simultáneas")
+    parser.add_argument("--stub", action="store_true", help="Usa un Ollama simulado (sin servidor)")
+    parser.add_argument("--stub-latency", type=float, default=0.2)
+    parser.add_argument("--stub-tps", type=float, default=50.0)
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
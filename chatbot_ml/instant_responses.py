@@ -0,0 +1,108 @@
+import datetime
+import json
+import string
+from collections import deque
+
+from text_normalization import normalize_text
+
+# -----------------------------
+# RESPUESTAS INSTANTÁNEAS COMPILADAS (AHO–CORASICK)
+# -----------------------------
+# Campos dinámicos disponibles en las respuestas; solo se calculan si la regla gana
+CAMPOS_DINAMICOS = {
+    "hora": lambda now: now.strftime('%H:%M:%S'),
+    "fecha_larga": lambda now: now.strftime('%A, %d de %B de %Y'),
+    "fecha": lambda now: now.strftime('%d/%m/%Y'),
+}
+
+
+class InstantRule:
+    def __init__(self, patterns, response, priority=0):
+        self.patterns = patterns
+        self.response = response
+        self.priority = priority
+        self.fields = [name for _, name, _, _ in string.Formatter().parse(response) if name]
+        unknown = set(self.fields) - set(CAMPOS_DINAMICOS)
+        if unknown:
+            raise ValueError(f"Campos dinámicos desconocidos en respuesta instantánea: {sorted(unknown)}")
+
+    def render(self):
+        if not self.fields:
+            return self.response
+        now = datetime.datetime.now()
+        return self.response.format(**{name: CAMPOS_DINAMICOS[name](now) for name in self.fields})
+
+
+class InstantMatcher:
+    """Autómata Aho–Corasick sobre todos los patrones de las reglas.
+
+    El coste de una consulta depende de la longitud del mensaje, no del número
+    de reglas. Si varios patrones aparecen, gana la regla de mayor prioridad y,
+    a igual prioridad, el patrón más largo.
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for rule_id, rule in enumerate(rules):
+            for pattern in rule.patterns:
+                self._add(normalize_text(pattern), rule_id)
+        self._build()
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls([
+            InstantRule(rule["patterns"], rule["response"], rule.get("priority", 0))
+            for rule in data["rules"]
+        ])
+
+    def _add(self, pattern, rule_id):
+        if not pattern:
+            return
+        state = 0
+        for ch in pattern:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append((rule_id, len(pattern)))
+
+    def _build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find(self, prompt):
+        """Regla ganadora para el mensaje, o None"""
+        goto, fail, out, rules = self._goto, self._fail, self._out, self.rules
+        best = None
+        best_rank = None
+        state = 0
+        for ch in normalize_text(prompt):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for rule_id, length in out[state]:
+                rank = (rules[rule_id].priority, length)
+                if best_rank is None or rank > best_rank:
+                    best, best_rank = rules[rule_id], rank
+        return best
+
+    def match(self, prompt):
+        rule = self.find(prompt)
+        return rule.render() if rule else None
@@ -0,0 +1,203 @@
+import argparse
+import atexit
+import glob
+import json
+import os
+import queue
+import threading
+import time
+from collections import Counter
+
+from text_normalization import normalize_text
+
+# -----------------------------
+# REGISTRO DE INTERACCIONES (ESCRITURA EN SEGUNDO PLANO)
+# -----------------------------
+LOTE_ESCRITURA = 256         # Eventos por escritura
+INTERVALO_VOLCADO = 1.0      # Segundos máximos que un evento espera en memoria
+FILAS_POR_SEGMENTO = 50_000  # Eventos por archivo antes de rotar
+MAX_COLA = 10_000            # Con la cola llena se descartan eventos (nunca se bloquea)
+TOP_CANDIDATOS = 20
+
+
+class SegmentWriter:
+    """Escribe diccionarios en segmentos JSONL desde un hilo en segundo plano.
+
+    `write` solo encola: el hilo escribe por lotes y rota el segmento cada
+    `segment_rows` eventos, así registrar no añade latencia a quien llama.
+    """
+
+    def __init__(self, directory, prefix, batch_size=LOTE_ESCRITURA, flush_interval=INTERVALO_VOLCADO,
+                 segment_rows=FILAS_POR_SEGMENTO, max_queue=MAX_COLA):
+        self.directory = directory
+        self.prefix = prefix
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.segment_rows = segment_rows
+        self.written = 0
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._file = None
+        self._segment_count = 0
+        self._closed = False
+        os.makedirs(directory, exist_ok=True)
+        self._writer = threading.Thread(target=self._run, daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def write(self, entry):
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def _open_segment(self):
+        if self._file:
+            self._file.close()
+        name = time.strftime(f"{self.prefix}_%Y%m%d_%H%M%S") + f"_{os.getpid()}_{self.written:09d}.jsonl"
+        self._file = open(os.path.join(self.directory, name), "a", encoding="utf-8")
+        self._segment_count = 0
+
+    def _write(self, batch):
+        try:
+            if self._file is None or self._segment_count >= self.segment_rows:
+                self._open_segment()
+            self._file.writelines(json.dumps(entry, ensure_ascii=False) + "\n" for entry in batch)
+            self._file.flush()
+            self._segment_count += len(batch)
+            self.written += len(batch)
+        except OSError as e:
+            print(f"Error al escribir {self.prefix}: {e}")
+
+    def _run(self):
+        while not (self._closed and self._queue.empty()):
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+    def close(self):
+        """Escribe los eventos pendientes y cierra el segmento abierto"""
+        self._closed = True
+        self._writer.join()
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
+def iter_segments(directory, prefix):
+    for path in sorted(glob.glob(os.path.join(directory, f"{prefix}_*.jsonl"))):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+class InteractionLog(SegmentWriter):
+    """Eventos de tráfico (nivel, score, latencias, correcciones) en segmentos JSONL.
+
+    Todos los eventos tienen las mismas claves para que los segmentos se
+    carguen directamente como tabla (pandas, DuckDB, Parquet).
+    """
+
+    def __init__(self, directory, **kwargs):
+        super().__init__(directory, "interactions", **kwargs)
+
+    def record(self, event, user_input, session=None, tier=None, score=None, model=None,
+               first_token_time=None, total_time=None, response=None):
+        entry = {
+            "ts": time.time(),
+            "event": event,
+            "session": session,
+            "key": normalize_text(user_input),
+            "question": user_input,
+            "tier": tier,
+            "score": score,
+            "model": model,
+            "first_token_time": first_token_time,
+            "total_time": total_time,
+            "response": response,
+        }
+        self.write(entry)
+
+    def record_result(self, user_input, result, session=None):
+        """Respuesta del motor; el texto solo se guarda si lo generó Ollama"""
+        self.record("response", user_input, session, result.tier, result.score, result.model,
+                    result.first_token_time, result.total_time,
+                    result.text if result.tier == "llm" else None)
+
+    def record_correction(self, user_input, answer):
+        """El usuario enseñó una respuesta para esta pregunta"""
+        self.record("correction", user_input, response=answer)
+
+
+# -----------------------------
+# ANÁLISIS OFFLINE
+# -----------------------------
+def iter_events(directory):
+    return iter_segments(directory, "interactions")
+
+
+def analyze(directory, top=TOP_CANDIDATOS):
+    """Reparto por nivel y preguntas más frecuentes respondidas por Ollama.
+
+    Las preguntas ya enseñadas (evento "correction") no se proponen: sus
+    siguientes consultas las responde la base de conocimiento.
+    """
+    tiers = Counter()
+    llm_keys = Counter()
+    examples = {}
+    llm_time = {}
+    taught = set()
+    for event in iter_events(directory):
+        if event["event"] == "correction":
+            taught.add(event["key"])
+            continue
+        tiers[event["tier"]] += 1
+        if event["tier"] == "llm":
+            key = event["key"]
+            llm_keys[key] += 1
+            examples.setdefault(key, event["question"])
+            llm_time[key] = llm_time.get(key, 0.0) + (event["total_time"] or 0.0)
+
+    candidates = [
+        {
+            "question": examples[key],
+            "key": key,
+            "count": count,
+            "llm_seconds": round(llm_time[key], 3),
+        }
+        for key, count in llm_keys.most_common()
+        if key not in taught
+    ][:top]
+    total = sum(tiers.values())
+    return {
+        "requests": total,
+        "tiers": {tier: {"n": n, "share": n / total} for tier, n in tiers.most_common()},
+        "corrections": len(taught),
+        "promotion_candidates": candidates,
+    }
+
+
+def main():
+    from chatbot_core import RUTA_INTERACCIONES
+
+    parser = argparse.ArgumentParser(description="Resume el registro de interacciones")
+    parser.add_argument("--dir", default=RUTA_INTERACCIONES, help="Carpeta con los segmentos JSONL")
+    parser.add_argument("--top", type=int, default=TOP_CANDIDATOS, help="Candidatas a promocionar a knowledge")
+    args = parser.parse_args()
+    print(json.dumps(analyze(args.dir, args.top), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
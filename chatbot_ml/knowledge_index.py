@@ -0,0 +1,403 @@
+import heapq
+import json
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from scipy.sparse import vstack
+
+from metrics import span
+from text_normalization import TextVectorizer
+
+# -----------------------------
+# ÍNDICE TF-IDF PRECALCULADO
+# -----------------------------
+UMBRAL_SIMILITUD = 0.45
+REAJUSTE_CADA = 50       # Altas acumuladas antes de reajustar vocabulario e IDF
+REAJUSTE_DERIVA = 0.2    # Fracción de tokens fuera de vocabulario que fuerza reajuste
+VERSION_INDICE = 3       # Cambia si cambia la normalización o el formato; los índices antiguos se reconstruyen
+FILAS_POR_SHARD = 100_000
+LOTE_LECTURA = 10_000    # Filas por consulta al recorrer la tabla
+CACHE_FILAS = 1024       # Filas (pregunta, respuesta) recientes en memoria
+HILOS_BUSQUEDA = min(4, os.cpu_count() or 1)
+
+
+class KnowledgeIndex:
+    """Índice TF-IDF de un rango de preguntas de `knowledge`, ajustado una sola vez.
+
+    Solo guarda los vectores y el id de cada fila; el texto se pide a la base de
+    datos por clave primaria. Las consultas solo hacen `transform` y un producto
+    disperso contra la matriz ya normalizada (L2), que equivale a la similitud
+    coseno. Las preguntas nuevas se añaden al momento con el vocabulario actual
+    y el reajuste completo (releyendo el rango con `loader`) se hace en segundo
+    plano al acumular suficientes altas.
+    """
+
+    def __init__(self, refit_after=REAJUSTE_CADA, max_drift=REAJUSTE_DERIVA, on_refit=None, loader=None):
+        self.vectorizer = None
+        self.matrix = None
+        self.ids = np.empty(0, dtype=np.int64)
+        self.refit_after = refit_after
+        self.max_drift = max_drift
+        self.on_refit = on_refit
+        self.loader = loader
+        self._lock = threading.Lock()
+        self._refit_thread = None
+        self._pending_rows = []
+        self._pending_tokens = 0
+        self._pending_unknown = 0
+
+    def __len__(self):
+        return len(self.ids)
+
+    def fit(self, rows):
+        """Ajusta vocabulario, IDF y matriz a partir de filas (id, pregunta)"""
+        ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        vectorizer, matrix = self._fit_matrix([row[1] for row in rows])
+        with self._lock:
+            self.ids = ids
+            self.vectorizer = vectorizer
+            self.matrix = matrix
+            self._reset_pending()
+        return self
+
+    @staticmethod
+    def _fit_matrix(questions):
+        if not questions:
+            return None, None
+        with span("index.fit"):
+            vectorizer = TextVectorizer()
+            return vectorizer, vectorizer.fit_transform(questions)
+
+    def _reset_pending(self):
+        self._pending_rows = []
+        self._pending_tokens = 0
+        self._pending_unknown = 0
+
+    def add(self, row_id, question):
+        """Añade una pregunta aprendida sin reconstruir el índice"""
+        with self._lock:
+            if self.vectorizer is None:
+                self.vectorizer, self.matrix = self._fit_matrix([question])
+            else:
+                tokens = self.vectorizer.build_analyzer()(question)
+                self._pending_tokens += len(tokens)
+                self._pending_unknown += sum(1 for t in tokens if t not in self.vectorizer.vocabulary_)
+                self.matrix = vstack([self.matrix, self.vectorizer.transform([question])], format="csr")
+                self._pending_rows.append((row_id, question))
+            self.ids = np.append(self.ids, row_id)
+            needs_refit = self._needs_refit()
+
+        if needs_refit:
+            self.start_refit()
+
+    def _needs_refit(self):
+        if self.loader is None:
+            return False
+        if len(self._pending_rows) >= self.refit_after:
+            return True
+        if self._pending_tokens and self._pending_unknown / self._pending_tokens >= self.max_drift:
+            return True
+        return False
+
+    def start_refit(self):
+        """Lanza el reajuste completo en segundo plano (si no hay uno en curso)"""
+        with self._lock:
+            if self._refit_thread and self._refit_thread.is_alive():
+                return
+            self._refit_thread = threading.Thread(target=self._refit, daemon=True)
+            self._refit_thread.start()
+
+    def join_refit(self, timeout=None):
+        """Espera a que termine el reajuste en curso"""
+        thread = self._refit_thread
+        if thread:
+            thread.join(timeout)
+
+    def _refit(self):
+        try:
+            rows = self.loader()
+            vectorizer, matrix = self._fit_matrix([question for _, question in rows])
+        except Exception as e:
+            print(f"Error al reajustar índice: {e}")
+            return
+        if vectorizer is None:
+            return
+
+        with self._lock:
+            # Preguntas añadidas mientras se releía el rango
+            fitted = {row_id for row_id, _ in rows}
+            extra = [(row_id, question) for row_id, question in self._pending_rows if row_id not in fitted]
+            ids = [row_id for row_id, _ in rows] + [row_id for row_id, _ in extra]
+            if extra:
+                matrix = vstack([matrix, vectorizer.transform([question for _, question in extra])], format="csr")
+            self.ids = np.asarray(ids, dtype=np.int64)
+            self.vectorizer = vectorizer
+            self.matrix = matrix
+            self._reset_pending()
+
+        if self.on_refit:
+            try:
+                self.on_refit(self)
+            except Exception as e:
+                print(f"Error tras reajustar índice: {e}")
+
+    def snapshot(self):
+        """(vectorizer, matrix, ids) leídos juntos: un alta o un reajuste los sustituye a la vez"""
+        with self._lock:
+            return self.vectorizer, self.matrix, self.ids
+
+    def search(self, user_input, k=1, min_score=0.0):
+        """[(id, score)] de las k preguntas más similares"""
+        vectorizer, matrix, ids = self.snapshot()
+        if matrix is None:
+            return []
+        similarity = (matrix @ vectorizer.transform([user_input]).T).toarray().ravel()
+        k = min(k, len(similarity))
+        top = np.argpartition(-similarity, k - 1)[:k]
+        top = top[np.argsort(-similarity[top])]
+        return [(int(ids[i]), float(similarity[i])) for i in top if similarity[i] > min_score]
+
+    def save(self, path):
+        """Guarda el índice ajustado en disco"""
+        with self._lock:
+            state = {
+                "version": VERSION_INDICE,
+                "vectorizer": self.vectorizer,
+                "matrix": self.matrix,
+                "ids": self.ids,
+            }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        """Carga un índice guardado con `save` (solo archivos de confianza)"""
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+        if state.get("version") != VERSION_INDICE:
+            raise ValueError("índice guardado con otra versión de la normalización")
+        index = cls(**kwargs)
+        index.vectorizer = state["vectorizer"]
+        index.matrix = state["matrix"]
+        index.ids = state["ids"]
+        return index
+
+
+# -----------------------------
+# ÍNDICE FRAGMENTADO POR RANGOS DE ID
+# -----------------------------
+class _Shard:
+    def __init__(self, first_id, last_id, rows, index=None):
+        self.first_id = first_id
+        self.last_id = last_id  # None en el último fragmento: recibe las altas nuevas
+        self.rows = rows
+        self.index = index
+
+    def to_dict(self):
+        return {"first_id": self.first_id, "last_id": self.last_id, "rows": self.rows}
+
+
+class ShardedKnowledgeIndex:
+    """Fragmentos `KnowledgeIndex` por rango de id, buscados en paralelo.
+
+    La tabla se recorre por lotes, sin cargar nunca todas las respuestas: los
+    fragmentos solo guardan vectores e ids, y el texto de las filas ganadoras
+    se pide por clave primaria detrás de un LRU pequeño. Los fragmentos
+    guardados en disco se cargan al primer uso.
+    """
+
+    def __init__(self, repository, path=None, shard_size=FILAS_POR_SHARD, workers=HILOS_BUSQUEDA,
+                 cache_size=CACHE_FILAS, **index_kwargs):
+        self.repository = repository
+        self.path = path
+        self.shard_size = shard_size
+        self.workers = workers
+        self.cache_size = cache_size
+        self.index_kwargs = index_kwargs
+        self.shards = []
+        self.scorer = None  # Alternativa para puntuar (p. ej. RetrievalPool)
+        self._rows = OrderedDict()  # id -> (pregunta, respuesta)
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def __len__(self):
+        return sum(len(shard.index) if shard.index is not None else shard.rows for shard in self.shards)
+
+    def _index_options(self, shard):
+        return {
+            "on_refit": lambda index: self._save_shard(shard),
+            "loader": lambda: self.repository.get_questions(shard.first_id, shard.last_id),
+            **self.index_kwargs,
+        }
+
+    def _add_shard(self, rows, last_id):
+        shard = _Shard(rows[0][0], last_id, len(rows))
+        shard.index = KnowledgeIndex(**self._index_options(shard)).fit(rows)
+        self.shards.append(shard)
+        return shard
+
+    def build(self):
+        """Recorre la tabla por lotes y ajusta un fragmento cada `shard_size` filas"""
+        self.shards = []
+        return self._index_from(0)
+
+    def refresh(self):
+        """Indexa las filas nuevas (p. ej. tras una importación masiva): conserva los
+        fragmentos cerrados y reajusta desde el último, el único abierto"""
+        if not self.loaded_shards():
+            return self.build()
+        with self._lock:
+            last = self.shards.pop()
+        return self._index_from(last.first_id - 1)
+
+    def _index_from(self, after_id):
+        rows = []
+        for batch in self.repository.iter_questions(LOTE_LECTURA, after_id):
+            rows.extend(batch)
+            while len(rows) >= self.shard_size:
+                chunk, rows = rows[:self.shard_size], rows[self.shard_size:]
+                self._add_shard(chunk, chunk[-1][0])
+        if rows:
+            self._add_shard(rows, None)
+        elif self.shards:
+            self.shards[-1].last_id = None
+        self.save()
+        return self
+
+    def _shard_path(self, position):
+        return os.path.join(self.path, f"shard_{position:04d}.pkl")
+
+    def _save_shard(self, shard):
+        if not self.path:
+            return
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            shard.rows = len(shard.index)
+            shard.index.save(self._shard_path(self.shards.index(shard)))
+            self._save_manifest()
+        except OSError as e:
+            print(f"Error al guardar índice: {e}")
+
+    def _save_manifest(self):
+        manifest = {"version": VERSION_INDICE, "shards": [shard.to_dict() for shard in self.shards]}
+        tmp_path = os.path.join(self.path, "manifest.json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, os.path.join(self.path, "manifest.json"))
+
+    def save(self):
+        if not self.path:
+            return
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            for position, shard in enumerate(self.shards):
+                if shard.index is not None:
+                    shard.rows = len(shard.index)
+                    shard.index.save(self._shard_path(position))
+            self._save_manifest()
+        except OSError as e:
+            print(f"Error al guardar índice: {e}")
+
+    @classmethod
+    def load(cls, repository, path, **kwargs):
+        """Lee el manifiesto; cada fragmento se carga de disco al primer uso"""
+        with open(os.path.join(path, "manifest.json"), encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("version") != VERSION_INDICE:
+            raise ValueError("índice guardado con otra versión de la normalización")
+        index = cls(repository, path, **kwargs)
+        index.shards = [_Shard(s["first_id"], s["last_id"], s["rows"]) for s in manifest["shards"]]
+        return index
+
+    def loaded_shards(self):
+        """Fragmentos con su índice en memoria (carga perezosa)"""
+        with self._lock:
+            for position, shard in enumerate(self.shards):
+                if shard.index is None:
+                    shard.index = KnowledgeIndex.load(self._shard_path(position), **self._index_options(shard))
+            return list(self.shards)
+
+    def add(self, row_id, question):
+        """Añade una pregunta aprendida al último fragmento (o abre uno nuevo si está lleno)"""
+        shards = self.loaded_shards()
+        if not shards or len(shards[-1].index) >= self.shard_size:
+            with self._lock:
+                if shards:
+                    shards[-1].last_id = row_id - 1
+                self._add_shard([(row_id, question)], None)
+            self.save()
+            return
+        shards[-1].index.add(row_id, question)
+
+    def last_id(self):
+        """Mayor id indexado (0 si el índice está vacío)"""
+        shards = self.loaded_shards()
+        if not shards or not len(shards[-1].index):
+            return 0
+        return int(shards[-1].index.ids[-1])
+
+    def join_refit(self, timeout=None):
+        for shard in self.shards:
+            if shard.index is not None:
+                shard.index.join_refit(timeout)
+
+    def search(self, user_input, k=1, min_score=0.0):
+        """[(id, score)] de las k preguntas más similares entre todos los fragmentos"""
+        if self.scorer is not None:
+            return self.scorer.search(user_input, k, min_score)
+        shards = self.loaded_shards()
+        if len(shards) == 1:
+            return shards[0].index.search(user_input, k, min_score)
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="knowledge-shard")
+        partial = self._pool.map(lambda shard: shard.index.search(user_input, k, min_score), shards)
+        return heapq.nlargest(k, (hit for hits in partial for hit in hits), key=lambda hit: hit[1])
+
+    def get_rows(self, ids):
+        """{id: (pregunta, respuesta)}, desde el LRU o por clave primaria"""
+        found = {}
+        with self._lock:
+            for row_id in ids:
+                row = self._rows.get(row_id)
+                if row is not None:
+                    self._rows.move_to_end(row_id)
+                    found[row_id] = row
+        missing = [row_id for row_id in ids if row_id not in found]
+        if missing:
+            fetched = self.repository.get_rows(missing)
+            with self._lock:
+                for row_id, row in fetched.items():
+                    self._rows[row_id] = row
+                while len(self._rows) > self.cache_size:
+                    self._rows.popitem(last=False)
+            found.update(fetched)
+        return found
+
+    def query(self, user_input, threshold=UMBRAL_SIMILITUD):
+        """Retorna (respuesta, score); respuesta es None si no supera el umbral"""
+        hits = self.search(user_input, 1)
+        if not hits:
+            return None, 0.0
+        row_id, score = hits[0]
+        if score > threshold:
+            row = self.get_rows([row_id]).get(row_id)
+            if row is not None:
+                return row[1], score
+        return None, score
+
+    def top_k(self, user_input, k=3, min_score=0.0):
+        """[(pregunta, respuesta, score)] de las k preguntas más similares"""
+        hits = self.search(user_input, k, min_score)
+        rows = self.get_rows([row_id for row_id, _ in hits])
+        return [(*rows[row_id], score) for row_id, score in hits if row_id in rows]
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
@@ -0,0 +1,174 @@
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sys
+import time
+
+from text_normalization import normalize_text
+
+# -----------------------------
+# IMPORTACIÓN / EXPORTACIÓN MASIVA DE KNOWLEDGE
+# -----------------------------
+LOTE_IMPORTACION = 5000   # Filas por transacción
+LOTE_EXPORTACION = 10_000
+INFORME_CADA = 100_000    # Filas entre mensajes de progreso
+
+
+def detect_format(path, explicit=None):
+    if explicit:
+        return explicit
+    return "jsonl" if os.path.splitext(path)[1].lower() in (".jsonl", ".ndjson", ".json") else "csv"
+
+
+def valid_pair(question, answer):
+    """Pregunta y respuesta sin espacios sobrantes, o None si alguna no es un texto no vacío"""
+    if not isinstance(question, str) or not isinstance(answer, str):
+        return None
+    question, answer = question.strip(), answer.strip()
+    return (question, answer) if question and answer else None
+
+
+def read_pairs(path, fmt):
+    """Recorre (pregunta, respuesta) de un CSV (columnas question, answer) o JSONL;
+    las filas sin ambos textos se ignoran"""
+    with open(path, encoding="utf-8", newline="") as f:
+        if fmt == "jsonl":
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    item = json.loads(line)
+                except ValueError as e:
+                    print(f"Línea {line_number} ignorada: {e}")
+                    continue
+                pair = valid_pair(item.get("question"), item.get("answer")) if isinstance(item, dict) else None
+                if pair is None:
+                    print(f"Línea {line_number} ignorada: se esperan 'question' y 'answer' como textos no vacíos")
+                    continue
+                yield pair
+        else:
+            for row in csv.DictReader(f):
+                pair = valid_pair(row.get("question"), row.get("answer"))
+                if pair:
+                    yield pair
+
+
+def question_digest(question):
+    """Huella de 8 bytes de la pregunta normalizada: el conjunto de deduplicación
+    ocupa poco aunque la tabla tenga millones de filas"""
+    return hashlib.blake2b(normalize_text(question).encode("utf-8"), digest_size=8).digest()
+
+
+def existing_digests(repository):
+    seen = set()
+    for batch in repository.iter_questions(LOTE_EXPORTACION):
+        seen.update(question_digest(question) for _, question in batch)
+    return seen
+
+
+def progress(label, rows, start):
+    elapsed = time.perf_counter() - start
+    print(f"{label}: {rows} filas en {elapsed:.1f}s ({rows / elapsed if elapsed else 0:.0f} filas/s)", flush=True)
+
+
+def import_file(repository, path, fmt=None, batch_size=LOTE_IMPORTACION, dedupe=True):
+    """Inserta el archivo por lotes transaccionales; retorna (insertadas, duplicadas)"""
+    seen = existing_digests(repository) if dedupe else set()
+    start = time.perf_counter()
+    inserted = duplicates = 0
+    next_report = INFORME_CADA
+    batch = []
+
+    def flush():
+        nonlocal inserted, next_report
+        inserted += repository.insert_many(batch)
+        batch.clear()
+        if inserted >= next_report:
+            progress("Importadas", inserted, start)
+            next_report += INFORME_CADA
+
+    for question, answer in read_pairs(path, detect_format(path, fmt)):
+        if dedupe:
+            digest = question_digest(question)
+            if digest in seen:
+                duplicates += 1
+                continue
+            seen.add(digest)
+        batch.append((question, answer))
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+    progress("Importadas", inserted, start)
+    return inserted, duplicates
+
+
+def export_file(repository, path, fmt=None, batch_size=LOTE_EXPORTACION):
+    """Escribe la tabla por lotes, sin cargarla entera en memoria; retorna filas escritas"""
+    fmt = detect_format(path, fmt)
+    start = time.perf_counter()
+    written = 0
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f) if fmt == "csv" else None
+        if writer:
+            writer.writerow(["question", "answer"])
+        for batch in repository.iter_rows(batch_size):
+            if writer:
+                writer.writerows((question, answer) for _, question, answer in batch)
+            else:
+                f.writelines(
+                    json.dumps({"question": question, "answer": answer}, ensure_ascii=False) + "\n"
+                    for _, question, answer in batch
+                )
+            written += len(batch)
+    progress("Exportadas", written, start)
+    return written
+
+
+def refresh_index(repository, path):
+    """Añade las filas nuevas al índice guardado (o lo construye si no existe)"""
+    from knowledge_index import ShardedKnowledgeIndex
+
+    start = time.perf_counter()
+    try:
+        index = ShardedKnowledgeIndex.load(repository, path).refresh()
+    except (OSError, ValueError):
+        index = ShardedKnowledgeIndex(repository, path).build()
+    progress("Indexadas", len(index), start)
+    return index
+
+
+def main():
+    from chatbot_core import RUTA_INDICE, repository
+
+    parser = argparse.ArgumentParser(description="Importa o exporta la tabla knowledge (CSV o JSONL)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    importer = sub.add_parser("import", help="Carga pares pregunta/respuesta")
+    importer.add_argument("path")
+    importer.add_argument("--format", choices=("csv", "jsonl"))
+    importer.add_argument("--batch", type=int, default=LOTE_IMPORTACION)
+    importer.add_argument("--no-dedupe", action="store_true", help="No compara con las preguntas existentes")
+    importer.add_argument("--no-index", action="store_true", help="No actualiza el índice de búsqueda")
+    exporter = sub.add_parser("export", help="Vuelca la tabla completa")
+    exporter.add_argument("path")
+    exporter.add_argument("--format", choices=("csv", "jsonl"))
+    exporter.add_argument("--batch", type=int, default=LOTE_EXPORTACION)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_file(repository, args.path, args.format, args.batch)
+        return
+
+    if not os.path.exists(args.path):
+        sys.exit(f"No existe el archivo: {args.path}")
+    inserted, duplicates = import_file(repository, args.path, args.format, args.batch, not args.no_dedupe)
+    print(f"✅ {inserted} filas nuevas, {duplicates} duplicadas omitidas")
+    if inserted and not args.no_index:
+        refresh_index(repository, RUTA_INDICE)
+
+
+if __name__ == "__main__":
+    main()
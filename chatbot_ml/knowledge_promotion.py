@@ -0,0 +1,292 @@
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+from collections import Counter
+
+from text_normalization import normalize_text
+
+# -----------------------------
+# PROMOCIÓN AUTOMÁTICA DE RESPUESTAS DE OLLAMA A KNOWLEDGE
+# -----------------------------
+UMBRAL_PROMOCION = 3          # Respuestas de Ollama a la misma pregunta normalizada
+APROBACION_AUTOMATICA = False # False: quedan en la cola de revisión
+INTERVALO_PROMOCION = 30.0    # Segundos entre escrituras en bloque
+MAX_SEGUIMIENTO = 10_000      # Preguntas distintas contadas en memoria
+MAX_COLA = 10_000
+
+
+def load_queue(path):
+    """Estado de la cola a partir de sus registros: {clave: entrada} por estado"""
+    state = {"queued": {}, "approved": {}, "rejected": {}, "promoted": {}}
+    if not path or not os.path.exists(path):
+        return state
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                apply_record(state, json.loads(line))
+    return state
+
+
+def apply_record(state, record):
+    key = record["key"]
+    if record["type"] == "queued":
+        state["queued"][key] = record
+        return
+    entry = state["queued"].pop(key, None) or state["approved"].pop(key, None)
+    if record["type"] == "promoted":
+        state["promoted"][key] = {**(entry or {}), **record}
+    elif entry is not None:
+        state[record["type"]][key] = entry
+
+
+def append_records(path, records):
+    try:
+        with open(path, "a", encoding="utf-8") as f:
+            f.writelines(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+    except OSError as e:
+        print(f"Error al escribir la cola de promoción: {e}")
+
+
+class AnswerPromoter:
+    """Cuenta las preguntas respondidas por Ollama y promociona las frecuentes.
+
+    Al llegar a `threshold` respuestas, la última se encola en `queue_path`
+    (JSON lines) para revisión, o se aprueba directamente con `auto_approve`.
+    Cada `interval` segundos un hilo escribe las aprobadas con
+    `learn_many(pares)` en un solo lote; las siguientes consultas las responde
+    la base de conocimiento. Las decisiones de revisión se añaden al mismo
+    archivo desde la línea de comandos y el hilo las aplica en su siguiente
+    ciclo.
+
+    Solo se cuentan preguntas sin historial de conversación: una respuesta que
+    depende de turnos anteriores no sirve como fila de knowledge.
+    """
+
+    def __init__(self, learn_many, queue_path, threshold=UMBRAL_PROMOCION, auto_approve=APROBACION_AUTOMATICA,
+                 interval=INTERVALO_PROMOCION, max_tracked=MAX_SEGUIMIENTO):
+        self.learn_many = learn_many
+        self.queue_path = queue_path
+        self.threshold = threshold
+        self.auto_approve = auto_approve
+        self.interval = interval
+        self.max_tracked = max_tracked
+        self.state = load_queue(queue_path)
+        self._offset = os.path.getsize(queue_path) if os.path.exists(queue_path) else 0
+        self._counts = Counter()
+        self._latest = {}    # clave -> (pregunta, respuesta)
+        self._llm_time = {}  # clave -> segundos de Ollama acumulados
+        self._events = queue.Queue(maxsize=MAX_COLA)
+        self._closed = False
+        self.stats = {"observed": 0, "queued": 0, "promoted": 0, "avoided_calls": 0, "avoided_seconds": 0.0}
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def observe(self, user_input, result, standalone=True):
+        """Encola una respuesta del motor (no bloquea)"""
+        try:
+            self._events.put_nowait(("result", user_input, result.tier, result.text, result.total_time, standalone))
+        except queue.Full:
+            pass
+
+    def forget(self, user_input):
+        """El usuario enseñó su propia respuesta: deja de contar esta pregunta"""
+        try:
+            self._events.put_nowait(("forget", user_input))
+        except queue.Full:
+            pass
+
+    # -----------------------------
+    # HILO DE PROMOCIÓN
+    # -----------------------------
+    def _run(self):
+        next_flush = time.monotonic() + self.interval
+        while not self._closed:
+            try:
+                event = self._events.get(timeout=max(0.0, next_flush - time.monotonic()))
+                if event is None:
+                    break
+                self._handle(event)
+            except queue.Empty:
+                pass
+            if time.monotonic() >= next_flush:
+                self._cycle()
+                next_flush = time.monotonic() + self.interval
+
+    def _handle(self, event):
+        key = normalize_text(event[1])
+        if event[0] == "forget":
+            self._drop(key)
+            if key in self.state["queued"] or key in self.state["approved"]:
+                self._append([{"type": "rejected", "key": key, "ts": time.time()}])
+            return
+
+        _, question, tier, text, total_time, standalone = event
+        self.stats["observed"] += 1
+        promoted = self.state["promoted"].get(key)
+        if promoted is not None:
+            if tier == "db":
+                self.stats["avoided_calls"] += 1
+                self.stats["avoided_seconds"] += promoted.get("llm_seconds", 0.0)
+            return
+        if tier != "llm" or not standalone or key in self.state["queued"] or key in self.state["approved"]:
+            return
+
+        self._counts[key] += 1
+        self._latest[key] = (question, text)
+        self._llm_time[key] = self._llm_time.get(key, 0.0) + total_time
+        if self._counts[key] >= self.threshold:
+            self._enqueue(key)
+        elif len(self._counts) > self.max_tracked:
+            # Se conservan las más frecuentes
+            for stale, _ in self._counts.most_common()[self.max_tracked // 2:]:
+                self._drop(stale)
+
+    def _enqueue(self, key):
+        question, answer = self._latest[key]
+        record = {
+            "type": "queued",
+            "key": key,
+            "ts": time.time(),
+            "question": question,
+            "answer": answer,
+            "count": self._counts[key],
+            "llm_seconds": self._llm_time[key] / self._counts[key],
+        }
+        self._drop(key)
+        records = [record]
+        if self.auto_approve:
+            records.append({"type": "approved", "key": key, "ts": record["ts"], "by": "auto"})
+        self._append(records)
+        self.stats["queued"] += 1
+
+    def _drop(self, key):
+        self._counts.pop(key, None)
+        self._latest.pop(key, None)
+        self._llm_time.pop(key, None)
+
+    def _append(self, records):
+        append_records(self.queue_path, records)
+        self._sync()
+
+    def _sync(self):
+        """Aplica los registros nuevos del archivo (propios o de la revisión manual)"""
+        if not os.path.exists(self.queue_path):
+            return
+        with open(self.queue_path, "rb") as f:
+            f.seek(self._offset)
+            data = f.read()
+        complete = data.rfind(b"\n") + 1  # Una línea a medio escribir se lee en el siguiente ciclo
+        for line in data[:complete].decode("utf-8").splitlines():
+            if line.strip():
+                apply_record(self.state, json.loads(line))
+        self._offset += complete
+
+    def _cycle(self):
+        self._sync()
+        approved = list(self.state["approved"].values())
+        if not approved:
+            return
+        try:
+            inserted = self.learn_many([(entry["question"], entry["answer"]) for entry in approved])
+        except Exception as e:
+            print(f"Error al promocionar respuestas: {e}")
+            return
+        if not inserted:
+            return
+        now = time.time()
+        self._append([
+            {"type": "promoted", "key": entry["key"], "ts": now, "llm_seconds": entry["llm_seconds"]}
+            for entry in approved
+        ])
+        self.stats["promoted"] += len(approved)
+
+    def report(self):
+        return {
+            **self.stats,
+            "pending_review": len(self.state["queued"]),
+            "tracked": len(self._counts),
+        }
+
+    def close(self):
+        """Escribe las aprobadas pendientes y detiene el hilo"""
+        self._closed = True
+        self._events.put(None)
+        self._worker.join()
+        while True:
+            try:
+                event = self._events.get_nowait()
+            except queue.Empty:
+                break
+            if event is not None:
+                self._handle(event)
+        self._cycle()
+
+
+# -----------------------------
+# REVISIÓN E INFORME (LÍNEA DE COMANDOS)
+# -----------------------------
+def avoided_calls(queue_path, interactions_dir):
+    """Consultas respondidas por knowledge gracias a una promoción, según el
+    registro de interacciones, y los segundos de Ollama que habrían costado"""
+    from interaction_log import iter_events
+
+    promoted = load_queue(queue_path)["promoted"]
+    calls = Counter()
+    seconds = 0.0
+    for event in iter_events(interactions_dir):
+        entry = promoted.get(event["key"])
+        if entry and event["tier"] == "db" and event["ts"] >= entry["ts"]:
+            calls[event["key"]] += 1
+            seconds += entry.get("llm_seconds", 0.0)
+    return {
+        "promoted": len(promoted),
+        "avoided_calls": sum(calls.values()),
+        "avoided_llm_seconds": round(seconds, 3),
+        "top": [
+            {"question": promoted[key].get("question", key), "hits": hits}
+            for key, hits in calls.most_common(10)
+        ],
+    }
+
+
+def main():
+    from chatbot_core import RUTA_COLA_PROMOCION, RUTA_INTERACCIONES
+
+    parser = argparse.ArgumentParser(description="Revisa las respuestas de Ollama propuestas para knowledge")
+    parser.add_argument("--queue", default=RUTA_COLA_PROMOCION)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="Muestra las pendientes de revisión")
+    approve = sub.add_parser("approve", help="Aprueba claves (la aplicación las escribe en su siguiente ciclo)")
+    approve.add_argument("keys", nargs="*")
+    approve.add_argument("--all", action="store_true")
+    reject = sub.add_parser("reject", help="Descarta claves")
+    reject.add_argument("keys", nargs="+")
+    report = sub.add_parser("report", help="Llamadas a Ollama evitadas")
+    report.add_argument("--interactions", default=RUTA_INTERACCIONES)
+    args = parser.parse_args()
+
+    state = load_queue(args.queue)
+    if args.command == "list":
+        for key, entry in state["queued"].items():
+            print(f"[{key}] x{entry['count']}  {entry['question']}\n    → {entry['answer']}\n")
+        print(f"{len(state['queued'])} pendientes, {len(state['approved'])} aprobadas sin escribir")
+    elif args.command == "report":
+        print(json.dumps(avoided_calls(args.queue, args.interactions), indent=2, ensure_ascii=False))
+    else:
+        keys = list(state["queued"]) if getattr(args, "all", False) else args.keys
+        unknown = [key for key in keys if key not in state["queued"]]
+        for key in unknown:
+            print(f"Clave no pendiente: {key}")
+        decision = "approved" if args.command == "approve" else "rejected"
+        now = time.time()
+        append_records(args.queue, [
+            {"type": decision, "key": key, "ts": now, "by": "review"} for key in keys if key not in unknown
+        ])
+        print(f"{len(keys) - len(unknown)} claves marcadas como {decision}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# -----------------------------
+# CONFIGURACIÓN DE BASE DE DATOS
+# -----------------------------
+MYSQL_CONFIG = {
+    "host": "localhost",
+    "user": "root",
+    "password": "",
+    "database": "chatbot_db",
+}
+TAMANO_POOL = 5
+MAX_IDS_CONSULTA = 500  # Ids por cada SELECT ... WHERE id IN (...)
+
+ESQUEMA_SQLITE = """
+CREATE TABLE IF NOT EXISTS knowledge (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL
+)
+"""
+
+
+# -----------------------------
+# BACKENDS
+# -----------------------------
+class MySQLBackend:
+    """Pool de conexiones MySQL reutilizables con sentencias preparadas"""
+
+    placeholder = "%s"
+
+    def __init__(self, pool_name="chatbot_pool", pool_size=TAMANO_POOL, **config):
+        import mysql.connector
+        from mysql.connector import pooling
+
+        self._connector = mysql.connector
+        self._pooling = pooling
+        self.errors = (mysql.connector.Error,)
+        self.pool_name = pool_name
+        self.pool_size = pool_size
+        self.config = {**MYSQL_CONFIG, **config}
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        # El pool se crea de forma perezosa para tolerar un MySQL que arranca después
+        with self._lock:
+            if self._pool is None:
+                self._pool = self._pooling.MySQLConnectionPool(
+                    pool_name=self.pool_name,
+                    pool_size=self.pool_size,
+                    pool_reset_session=True,
+                    autocommit=True,
+                    **self.config,
+                )
+            return self._pool
+
+    @contextmanager
+    def connection(self):
+        conn = self._get_pool().get_connection()
+        try:
+            # Health check: reabre la conexión si MySQL la cerró por inactividad
+            conn.ping(reconnect=True, attempts=2, delay=0)
+            yield conn
+        finally:
+            conn.close()  # Devuelve la conexión al pool
+
+    def cursor(self, conn):
+        return conn.cursor(prepared=True)
+
+    def bulk_cursor(self, conn):
+        # Sin preparar: executemany agrupa las filas en un único INSERT multi-fila
+        return conn.cursor()
+
+    def begin(self, conn):
+        conn.start_transaction()
+
+    def reset(self):
+        with self._lock:
+            self._pool = None
+
+
+class SQLiteBackend:
+    """Almacenamiento local SQLite, útil para pruebas sin servidor MySQL"""
+
+    placeholder = "?"
+    errors = (sqlite3.Error,)
+
+    def __init__(self, path=":memory:"):
+        self.path = path
+        self._conn = None
+        self._lock = threading.RLock()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute(ESQUEMA_SQLITE)
+        return conn
+
+    @contextmanager
+    def connection(self):
+        with self._lock:
+            if self._conn is None:
+                self._conn = self._connect()
+            yield self._conn
+
+    def cursor(self, conn):
+        return conn.cursor()
+
+    bulk_cursor = cursor
+
+    def begin(self, conn):
+        conn.execute("BEGIN")
+
+    def reset(self):
+        with self._lock:
+            # Una base en memoria se perdería al cerrarla
+            if self._conn is not None and self.path != ":memory:":
+                self._conn.close()
+                self._conn = None
+
+
+# -----------------------------
+# REPOSITORIO DE CONOCIMIENTO
+# -----------------------------
+class KnowledgeRepository:
+    """Acceso a la tabla `knowledge` sobre un backend intercambiable"""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def _sql(self, sql):
+        return sql.replace("%s", self.backend.placeholder)
+
+    def _execute(self, sql, params=(), fetch=None):
+        # Un único reintento tras reiniciar el backend si la conexión falló
+        for attempt in range(2):
+            try:
+                with self.backend.connection() as conn:
+                    cursor = self.backend.cursor(conn)
+                    try:
+                        cursor.execute(self._sql(sql), params)
+                        if fetch == "all":
+                            return cursor.fetchall()
+                        if fetch == "one":
+                            return cursor.fetchone()
+                        if fetch == "lastrowid":
+                            return cursor.lastrowid
+                        return cursor.rowcount
+                    finally:
+                        cursor.close()
+            except self.backend.errors:
+                if attempt:
+                    raise
+                self.backend.reset()
+
+    def get_all(self):
+        try:
+            return [tuple(row) for row in self._execute("SELECT question, answer FROM knowledge", fetch="all")]
+        except self.backend.errors as e:
+            print(f"Error al obtener datos: {e}")
+            return []
+
+    def _iter_batches(self, columns, batch_size, after_id):
+        # Paginación por clave (id > último visto): coste constante por lote
+        last_id = after_id
+        while True:
+            try:
+                batch = self._execute(
+                    f"SELECT {columns} FROM knowledge WHERE id > %s ORDER BY id LIMIT %s",
+                    (last_id, batch_size), fetch="all",
+                )
+            except self.backend.errors as e:
+                print(f"Error al recorrer datos: {e}")
+                return
+            if not batch:
+                return
+            batch = [tuple(row) for row in batch]
+            yield batch
+            last_id = batch[-1][0]
+
+    def iter_questions(self, batch_size, after_id=0):
+        """Recorre (id, pregunta) por lotes ordenados por id, sin cargar las respuestas"""
+        return self._iter_batches("id, question", batch_size, after_id)
+
+    def iter_rows(self, batch_size, after_id=0):
+        """Recorre (id, pregunta, respuesta) por lotes ordenados por id"""
+        return self._iter_batches("id, question, answer", batch_size, after_id)
+
+    def get_questions(self, first_id, last_id=None):
+        """(id, pregunta) del rango de ids [first_id, last_id]; sin límite superior si last_id es None"""
+        if last_id is None:
+            sql, params = "SELECT id, question FROM knowledge WHERE id >= %s ORDER BY id", (first_id,)
+        else:
+            sql, params = "SELECT id, question FROM knowledge WHERE id BETWEEN %s AND %s ORDER BY id", (first_id, last_id)
+        try:
+            return [tuple(row) for row in self._execute(sql, params, fetch="all")]
+        except self.backend.errors as e:
+            print(f"Error al obtener datos: {e}")
+            return []
+
+    def get_rows(self, ids):
+        """{id: (pregunta, respuesta)} por clave primaria"""
+        rows = {}
+        ids = list(ids)
+        try:
+            for start in range(0, len(ids), MAX_IDS_CONSULTA):
+                chunk = ids[start:start + MAX_IDS_CONSULTA]
+                placeholders = ", ".join(["%s"] * len(chunk))
+                for row_id, question, answer in self._execute(
+                    f"SELECT id, question, answer FROM knowledge WHERE id IN ({placeholders})",
+                    tuple(chunk), fetch="all",
+                ):
+                    rows[row_id] = (question, answer)
+        except self.backend.errors as e:
+            print(f"Error al obtener datos: {e}")
+        return rows
+
+    def count(self):
+        try:
+            return self._execute("SELECT COUNT(*) FROM knowledge", fetch="one")[0]
+        except self.backend.errors as e:
+            print(f"Error al contar datos: {e}")
+            return None
+
+    def insert(self, question, answer):
+        """Id de la fila nueva, o False si no se pudo insertar"""
+        try:
+            return self._execute(
+                "INSERT INTO knowledge (question, answer) VALUES (%s, %s)", (question, answer), fetch="lastrowid"
+            )
+        except self.backend.errors as e:
+            print(f"Error al insertar datos: {e}")
+            return False
+
+    def insert_many(self, rows):
+        """Inserta filas (pregunta, respuesta) en una sola transacción; retorna cuántas"""
+        rows = list(rows)
+        if not rows:
+            return 0
+        try:
+            with self.backend.connection() as conn:
+                cursor = self.backend.bulk_cursor(conn)
+                try:
+                    self.backend.begin(conn)
+                    cursor.executemany(self._sql("INSERT INTO knowledge (question, answer) VALUES (%s, %s)"), rows)
+                    conn.commit()
+                except self.backend.errors:
+                    conn.rollback()
+                    raise
+                finally:
+                    cursor.close()
+            return len(rows)
+        except self.backend.errors as e:
+            print(f"Error al insertar lote: {e}")
+            return 0
+
+    def ping(self):
+        """Health check: True si el backend responde"""
+        try:
+            self._execute("SELECT 1", fetch="one")
+            return True
+        except self.backend.errors:
+            return False
+
+
+def create_repository():
+    """Repositorio por defecto: MySQL, o SQLite si CHATBOT_SQLITE indica una ruta"""
+    sqlite_path = os.environ.get("CHATBOT_SQLITE")
+    if sqlite_path:
+        return KnowledgeRepository(SQLiteBackend(sqlite_path))
+    return KnowledgeRepository(MySQLBackend())
@@ -0,0 +1,169 @@
+import asyncio
+import itertools
+import json
+import os
+import time
+from collections import deque
+
+from metrics import metrics
+
+# -----------------------------
+# PLANIFICADOR DE PETICIONES A OLLAMA
+# -----------------------------
+OLLAMA_NUM_PARALLEL = int(os.environ.get("OLLAMA_NUM_PARALLEL", "1"))
+VENTANA_LOTE = 0.01   # segundos para agrupar peticiones que llegan a la vez
+MUESTRAS_ESPERA = 1000
+
+
+class _Flight:
+    """Una generación compartida por todas las peticiones idénticas en curso"""
+
+    def __init__(self, key, request):
+        self.key = key
+        self.request = request
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        self.enqueued_at = time.monotonic()
+        self.task = None
+        self._waiters = []
+
+    def _notify(self):
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        self._waiters = []
+
+    def append(self, chunk):
+        self.chunks.append(chunk)
+        self._notify()
+
+    def finish(self, error=None):
+        self.done = True
+        self.error = error
+        self._notify()
+
+    async def chunks_from_start(self):
+        """Repite los fragmentos ya generados y sigue con los nuevos"""
+        position = 0
+        while True:
+            while position < len(self.chunks):
+                yield self.chunks[position]
+                position += 1
+            if self.done:
+                if self.error:
+                    raise self.error
+                return
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            await waiter
+
+
+class LLMScheduler:
+    """Envoltorio de ollama.AsyncClient con cola, single-flight y prioridad.
+
+    - Peticiones idénticas en curso comparten una sola generación.
+    - Como máximo `parallelism` generaciones a la vez (igual que OLLAMA_NUM_PARALLEL).
+    - En la cola tienen prioridad los prompts más cortos.
+    - Las peticiones que llegan dentro de `window` segundos se ordenan juntas.
+    """
+
+    def __init__(self, client, parallelism=OLLAMA_NUM_PARALLEL, window=VENTANA_LOTE):
+        self.client = client
+        self.parallelism = max(1, parallelism)
+        self.window = window
+        self._queue = None
+        self._workers = []
+        self._inflight = {}
+        self._sequence = itertools.count()
+        self._waits = deque(maxlen=MUESTRAS_ESPERA)
+        self.stats = {"requests": 0, "deduplicated": 0, "dispatched": 0, "abandoned": 0}
+
+    def __getattr__(self, name):
+        # embed, list, ps... pasan directamente al cliente real
+        return getattr(self.client, name)
+
+    def _start_workers(self):
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue()
+            self._workers = [asyncio.ensure_future(self._worker()) for _ in range(self.parallelism)]
+
+    async def chat(self, model, messages, options=None, stream=False, **kwargs):
+        self._start_workers()
+        self.stats["requests"] += 1
+        request = {"model": model, "messages": messages, "options": options, **kwargs}
+        key = json.dumps(request, sort_keys=True, ensure_ascii=False, default=str)
+
+        flight = self._inflight.get(key)
+        if flight is None:
+            flight = _Flight(key, request)
+            self._inflight[key] = flight
+            prompt_size = sum(len(m.get('content', '')) for m in messages)
+            self._queue.put_nowait((prompt_size, next(self._sequence), flight))
+        else:
+            self.stats["deduplicated"] += 1
+
+        if stream:
+            return self._subscribe(flight)
+        chunks = [chunk async for chunk in self._subscribe(flight)]
+        content = "".join(chunk['message']['content'] for chunk in chunks)
+        return {'model': model, 'message': {'role': 'assistant', 'content': content}, 'done': True}
+
+    async def _subscribe(self, flight):
+        flight.subscribers += 1
+        try:
+            async for chunk in flight.chunks_from_start():
+                yield chunk
+        finally:
+            flight.subscribers -= 1
+            if not flight.subscribers and not flight.done:
+                # Nadie espera ya esta generación: se cancela o se descarta de la cola
+                self.stats["abandoned"] += 1
+                self._inflight.pop(flight.key, None)
+                if flight.task:
+                    flight.task.cancel()
+                flight.finish(asyncio.CancelledError())
+
+    async def _worker(self):
+        while True:
+            item = await self._queue.get()
+            if self.window and self._queue.empty():
+                # Ventana de agrupación: da prioridad a prompts cortos que lleguen justo después
+                await asyncio.sleep(self.window)
+                self._queue.put_nowait(item)
+                item = self._queue.get_nowait()
+            _, _, flight = item
+            if flight.done:
+                continue
+            wait = time.monotonic() - flight.enqueued_at
+            self._waits.append(wait)
+            metrics.observe("llm.queue", wait)
+            self.stats["dispatched"] += 1
+            flight.task = asyncio.ensure_future(self._generate(flight))
+            await asyncio.wait({flight.task})
+
+    async def _generate(self, flight):
+        try:
+            stream = await self.client.chat(**flight.request, stream=True)
+            async for chunk in stream:
+                flight.append(chunk)
+            flight.finish()
+        except asyncio.CancelledError:
+            flight.finish(asyncio.CancelledError())
+        except Exception as e:
+            flight.finish(e)
+        finally:
+            if self._inflight.get(flight.key) is flight:
+                del self._inflight[flight.key]
+
+    def metrics(self):
+        waits = sorted(self._waits)
+        return {
+            **self.stats,
+            "parallelism": self.parallelism,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "in_flight": len(self._inflight),
+            "wait_p50_ms": 1000 * waits[len(waits) // 2] if waits else 0.0,
+            "wait_p95_ms": 1000 * waits[int(len(waits) * 0.95)] if waits else 0.0,
+        }
@@ -0,0 +1,160 @@
+import contextvars
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# -----------------------------
+# MÉTRICAS DE LATENCIA POR NIVEL
+# -----------------------------
+MUESTRAS_HISTOGRAMA = 2048   # Ventana deslizante por span
+CUANTILES = (0.5, 0.95, 0.99)
+
+_current_trace = contextvars.ContextVar("chatbot_trace", default=None)
+
+
+class Trace:
+    """Spans de una petición y el nivel que la respondió"""
+
+    def __init__(self, session_id=None):
+        self.session_id = session_id
+        self.started_at = time.time()
+        self.spans = []
+        self.tier = None
+
+    def to_dict(self):
+        return {
+            "ts": self.started_at,
+            "session": self.session_id,
+            "tier": self.tier,
+            "spans": {name: round(duration, 6) for name, duration in self.spans},
+        }
+
+
+class Metrics:
+    """Histogramas deslizantes por span y contadores por nivel, exportables a
+    Prometheus (texto) o JSON lines"""
+
+    def __init__(self, window=MUESTRAS_HISTOGRAMA, trace_path=None):
+        self.window = window
+        self.trace_path = trace_path
+        self._samples = {}
+        self._counts = {}
+        self._sums = {}
+        self._tiers = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, seconds):
+        with self._lock:
+            samples = self._samples.get(name)
+            if samples is None:
+                samples = self._samples[name] = deque(maxlen=self.window)
+            samples.append(seconds)
+            self._counts[name] = self._counts.get(name, 0) + 1
+            self._sums[name] = self._sums.get(name, 0.0) + seconds
+
+    def record(self, name, seconds):
+        """Registra una duración en el histograma y en la traza activa (si la hay)"""
+        self.observe(name, seconds)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.spans.append((name, seconds))
+
+    @contextmanager
+    def span(self, name):
+        """Mide un bloque con `record`"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    @contextmanager
+    def trace(self, session_id=None):
+        """Abre una traza para una petición; los spans anidados (incluso en
+        asyncio.to_thread, que copia el contexto) se asocian a ella"""
+        trace = Trace(session_id)
+        token = _current_trace.set(trace)
+        try:
+            with self.span("request"):
+                yield trace
+        finally:
+            _current_trace.reset(token)
+            self.finish(trace)
+
+    def finish(self, trace):
+        with self._lock:
+            tier = trace.tier or "error"
+            self._tiers[tier] = self._tiers.get(tier, 0) + 1
+        if self.trace_path:
+            try:
+                with self._lock, open(self.trace_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(trace.to_dict(), ensure_ascii=False) + "\n")
+            except OSError as e:
+                print(f"Error al exportar traza: {e}")
+
+    def quantiles(self, name):
+        with self._lock:
+            samples = sorted(self._samples.get(name, ()))
+        if not samples:
+            return {}
+        return {q: samples[min(len(samples) - 1, int(q * len(samples)))] for q in CUANTILES}
+
+    def snapshot(self):
+        with self._lock:
+            names = list(self._samples)
+            counts = dict(self._counts)
+            sums = dict(self._sums)
+            tiers = dict(self._tiers)
+        return {
+            "spans": {
+                name: {
+                    "count": counts[name],
+                    "sum": sums[name],
+                    **{f"p{int(q * 100)}": v for q, v in self.quantiles(name).items()},
+                }
+                for name in names
+            },
+            "tiers": tiers,
+        }
+
+    def to_prometheus(self):
+        snapshot = self.snapshot()
+        lines = [
+            "# HELP chatbot_span_seconds Duración de cada nivel y sub-paso",
+            "# TYPE chatbot_span_seconds summary",
+        ]
+        for name, data in sorted(snapshot["spans"].items()):
+            for q in CUANTILES:
+                key = f"p{int(q * 100)}"
+                if key in data:
+                    lines.append(f'chatbot_span_seconds{{span="{name}",quantile="{q}"}} {data[key]:.6f}')
+            lines.append(f'chatbot_span_seconds_sum{{span="{name}"}} {data["sum"]:.6f}')
+            lines.append(f'chatbot_span_seconds_count{{span="{name}"}} {data["count"]}')
+        lines += [
+            "# HELP chatbot_tier_total Peticiones respondidas por cada nivel",
+            "# TYPE chatbot_tier_total counter",
+        ]
+        for tier, count in sorted(snapshot["tiers"].items()):
+            lines.append(f'chatbot_tier_total{{tier="{tier}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def to_json_line(self):
+        return json.dumps({"ts": time.time(), **self.snapshot()}, ensure_ascii=False)
+
+    def footer_text(self):
+        """Resumen corto para el pie de la interfaz"""
+        snapshot = self.snapshot()
+        request = snapshot["spans"].get("request")
+        if not request:
+            return None
+        total = sum(snapshot["tiers"].values()) or 1
+        tiers = " ".join(
+            f"{tier} {100 * count / total:.0f}%" for tier, count in sorted(snapshot["tiers"].items())
+        )
+        return f"⏱ p50 {request['p50']:.2f}s · p95 {request['p95']:.2f}s · p99 {request['p99']:.2f}s | {tiers}"
+
+
+metrics = Metrics()
+span = metrics.span
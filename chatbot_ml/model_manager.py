@@ -0,0 +1,106 @@
+import datetime
+import threading
+
+import ollama
+
+# -----------------------------
+# CICLO DE VIDA DEL MODELO OLLAMA
+# -----------------------------
+KEEP_ALIVE = "30m"      # Tiempo que Ollama mantiene el modelo en memoria tras cada uso
+INTERVALO_SALUD = 60    # segundos entre comprobaciones de estado
+
+ESTADOS = {
+    "unknown": "⚪ Comprobando Ollama...",
+    "loading": "🟡 Cargando modelo...",
+    "ready": "🟢 Conectado - Ollama Local",
+    "unloaded": "🟡 Modelo descargado de memoria",
+    "missing": "🔴 Modelo no instalado",
+    "offline": "🔴 Ollama no disponible",
+}
+
+
+class ModelManager:
+    """Precarga el modelo, lo mantiene caliente y vigila el estado de Ollama.
+
+    Todo ocurre en un hilo en segundo plano; los cambios de estado se notifican
+    a los oyentes registrados con `add_listener(callback(estado, texto))`.
+    """
+
+    def __init__(self, model, keep_alive=KEEP_ALIVE, interval=INTERVALO_SALUD, client=None):
+        self.model = model
+        self.keep_alive = keep_alive
+        self.interval = interval
+        self.client = client or ollama.Client()
+        self.state = "unknown"
+        self.detail = ""
+        self._listeners = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+        callback(self.state, self.status_text())
+
+    def status_text(self):
+        text = ESTADOS[self.state]
+        return f"{text} ({self.detail})" if self.detail else text
+
+    def _set_state(self, state, detail=""):
+        if state == self.state and detail == self.detail:
+            return
+        self.state = state
+        self.detail = detail
+        for callback in self._listeners:
+            try:
+                callback(state, self.status_text())
+            except Exception as e:
+                print(f"Error al notificar estado del modelo: {e}")
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        self.warm_up()
+        while not self._stop.wait(self.interval):
+            self.check()
+
+    def warm_up(self):
+        """Carga el modelo con un prompt vacío y fija su keep_alive"""
+        self._set_state("loading")
+        try:
+            self.client.generate(model=self.model, prompt="", keep_alive=self.keep_alive)
+            self._set_state("ready")
+        except ollama.ResponseError as e:
+            self._set_state("missing" if e.status_code == 404 else "offline", str(e.error))
+        except Exception as e:
+            if self.state != "offline":
+                print(f"Ollama no disponible: {e}")
+            self._set_state("offline")
+
+    def check(self):
+        """Health check: recarga el modelo si Ollama lo descargó o está a punto de hacerlo"""
+        try:
+            loaded = {m.model: m for m in self.client.ps().models}
+        except Exception:
+            self._set_state("offline")
+            return
+
+        running = loaded.get(self.model)
+        if running is None:
+            self._set_state("unloaded")
+            self.warm_up()
+            return
+
+        expires_at = running.expires_at
+        if expires_at is not None:
+            remaining = (expires_at - datetime.datetime.now(expires_at.tzinfo)).total_seconds()
+            if remaining < 2 * self.interval:
+                # Sin tráfico reciente: ping para renovar el keep_alive
+                self.warm_up()
+                return
+        self._set_state("ready")
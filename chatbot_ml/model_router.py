@@ -0,0 +1,131 @@
+import argparse
+import json
+import threading
+import time
+
+from interaction_log import iter_segments
+from text_normalization import normalize_text
+
+# -----------------------------
+# ENRUTADO ENTRE MODELO RÁPIDO Y MODELO GRANDE
+# -----------------------------
+RUTAS = {
+    "rapido": {
+        "model": "llama3.2:1b",
+        "options": {'temperature': 0.3, 'num_predict': 120},
+    },
+    "completo": {
+        "model": "llama3.2:3b",
+        "options": {'temperature': 0.5, 'num_predict': 300},
+    },
+}
+PALABRAS_DIFICIL = 25       # Prompts más largos van al modelo grande
+SCORE_CERCANO = 0.25        # Con una fila de knowledge parecida basta el modelo rápido
+INTENCIONES_DIFICILES = (
+    "explica", "explicame", "por que", "compara", "diferencia", "analiza",
+    "paso a paso", "codigo", "programa", "como funciona", "ventajas", "desventajas",
+)
+
+
+class RouteDecision:
+    def __init__(self, route, model, options, reason, words, intent, score):
+        self.route = route
+        self.model = model
+        self.options = options
+        self.reason = reason
+        self.words = words
+        self.intent = intent
+        self.score = score
+        self.started_at = time.time()
+
+
+class ModelRouter:
+    """Clasifica cada prompt por longitud, intención y score TF-IDF y elige ruta.
+
+    Con `log` (un SegmentWriter con prefijo "routing") cada decisión se encola
+    junto con su latencia y tokens, para ajustar los umbrales a partir de
+    trazas reales; la escritura ocurre en otro hilo, fuera del bucle asyncio.
+    """
+
+    def __init__(self, routes=RUTAS, long_words=PALABRAS_DIFICIL, near_score=SCORE_CERCANO,
+                 hard_intents=INTENCIONES_DIFICILES, log=None):
+        self.routes = routes
+        self.long_words = long_words
+        self.near_score = near_score
+        self.hard_intents = hard_intents
+        self.log = log
+        self._lock = threading.Lock()
+        self.counts = {name: 0 for name in routes}
+
+    def detect_intent(self, text):
+        for intent in self.hard_intents:
+            if intent in text:
+                return intent
+        return None
+
+    def route(self, prompt, score=None):
+        text = normalize_text(prompt)
+        words = len(text.split())
+        intent = self.detect_intent(text)
+
+        if score is not None and score >= self.near_score:
+            name, reason = "rapido", "knowledge_cercano"
+        elif intent:
+            name, reason = "completo", "intencion"
+        elif words > self.long_words:
+            name, reason = "completo", "longitud"
+        else:
+            name, reason = "rapido", "simple"
+
+        route = self.routes[name]
+        with self._lock:
+            self.counts[name] += 1
+        return RouteDecision(name, route["model"], route["options"], reason, words, intent, score)
+
+    def record(self, decision, result):
+        """Registra la decisión con el resultado obtenido"""
+        if self.log is None:
+            return
+        self.log.write({
+            "ts": decision.started_at,
+            "route": decision.route,
+            "model": decision.model,
+            "reason": decision.reason,
+            "words": decision.words,
+            "intent": decision.intent,
+            "score": decision.score,
+            "tier": result.tier,
+            "first_token_time": result.first_token_time,
+            "total_time": result.total_time,
+            "prompt_tokens": result.prompt_tokens,
+            "response_chars": len(result.text),
+        })
+
+
+def summarize_log(directory):
+    """Latencia media y p95 por ruta y motivo a partir de los segmentos de decisiones"""
+    groups = {}
+    for entry in iter_segments(directory, "routing"):
+        groups.setdefault((entry["route"], entry["reason"]), []).append(entry["total_time"])
+    report = {}
+    for (route, reason), times in sorted(groups.items()):
+        times.sort()
+        report[f"{route}/{reason}"] = {
+            "n": len(times),
+            "mean_s": sum(times) / len(times),
+            "p95_s": times[int(len(times) * 0.95)],
+        }
+    return report
+
+
+def main():
+    from chatbot_core import RUTA_LOG_RUTAS
+
+    parser = argparse.ArgumentParser(description="Resume las decisiones del enrutador de modelos")
+    parser.add_argument("--dir", default=RUTA_LOG_RUTAS, help="Carpeta con los segmentos JSONL")
+    args = parser.parse_args()
+    print(json.dumps(summarize_log(args.dir), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+import asyncio
+
+# -----------------------------
+# OLLAMA SIMULADO (SIN SERVIDOR)
+# -----------------------------
+class StubAsyncClient:
+    """Sustituto local de ollama.AsyncClient con latencia y ritmo de tokens configurables"""
+
+    def __init__(self, latency=0.2, tokens_per_second=50.0, reply=None):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.reply = reply or (lambda prompt: f"Respuesta simulada sobre: {prompt}")
+        self.calls = 0
+
+    def _tokens(self, messages):
+        text = self.reply(messages[-1]['content'])
+        words = text.split(" ")
+        return [w if i == 0 else f" {w}" for i, w in enumerate(words)]
+
+    async def chat(self, model, messages, options=None, stream=False, **kwargs):
+        self.calls += 1
+        tokens = self._tokens(messages)
+        if stream:
+            return self._stream(model, tokens)
+        await asyncio.sleep(self.latency + len(tokens) / self.tokens_per_second)
+        return {'model': model, 'message': {'role': 'assistant', 'content': "".join(tokens)}, 'done': True}
+
+    async def _stream(self, model, tokens):
+        await asyncio.sleep(self.latency)
+        for token in tokens:
+            await asyncio.sleep(1 / self.tokens_per_second)
+            yield {'model': model, 'message': {'role': 'assistant', 'content': token}, 'done': False}
+        yield {'model': model, 'message': {'role': 'assistant', 'content': ''}, 'done': True}
@@ -0,0 +1,83 @@
+import threading
+import time
+from collections import OrderedDict
+
+from text_normalization import normalize_text
+
+# -----------------------------
+# CACHÉ DE RESPUESTAS ACOTADO
+# -----------------------------
+CACHE_MAX_ENTRADAS = 2000
+CACHE_MAX_BYTES = 4 * 1024 * 1024
+CACHE_TTL = 3600  # segundos
+
+class ResponseCache:
+    """Caché LRU con TTL, límite de entradas/bytes y contadores, seguro entre hilos"""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRADAS, max_bytes=CACHE_MAX_BYTES, ttl=CACHE_TTL):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._data = OrderedDict()  # clave -> (respuesta, expira, bytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, user_input):
+        key = normalize_text(user_input)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            response, expires, _ = entry
+            if self.ttl and expires < time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return response
+
+    def set(self, user_input, response):
+        key = normalize_text(user_input)
+        size = len(key.encode("utf-8")) + len(response.encode("utf-8"))
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (response, expires, size)
+            self._bytes += size
+            while self._data and (
+                len(self._data) > self.max_entries or (self.max_bytes and self._bytes > self.max_bytes)
+            ):
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, _, size = self._data.pop(key)
+        self._bytes -= size
+
+    def clear(self):
+        """Invalida todas las entradas (p. ej. tras cambiar la base de conocimiento)"""
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
@@ -0,0 +1,218 @@
+import heapq
+import json
+import os
+import pickle
+import queue
+import shutil
+import tempfile
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+# -----------------------------
+# POOL DE PROCESOS PARA PUNTUAR CONSULTAS
+# -----------------------------
+PROCESOS_RECUPERACION = os.cpu_count() or 1
+VENTANA_LOTE = 0.002   # segundos que se esperan consultas para agruparlas
+MAX_LOTE = 64          # consultas por producto matriz-matriz
+
+_attached = {}  # En cada proceso: ruta del fragmento -> (vectorizer, matrix, ids)
+
+
+def export_shard(index, path):
+    """Escribe el fragmento como arrays .npy que los procesos abren con mmap"""
+    vectorizer, matrix, ids = index.snapshot()
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, "data.npy"), matrix.data)
+    np.save(os.path.join(path, "indices.npy"), matrix.indices)
+    np.save(os.path.join(path, "indptr.npy"), matrix.indptr)
+    np.save(os.path.join(path, "ids.npy"), ids)
+    with open(os.path.join(path, "vectorizer.pkl"), "wb") as f:
+        pickle.dump(vectorizer, f, protocol=pickle.HIGHEST_PROTOCOL)
+    with open(os.path.join(path, "shape.json"), "w", encoding="utf-8") as f:
+        json.dump(list(matrix.shape), f)
+
+
+def _attach(path):
+    """Abre un fragmento una sola vez por proceso; los arrays se comparten vía caché de páginas"""
+    shard = _attached.get(path)
+    if shard is None:
+        with open(os.path.join(path, "vectorizer.pkl"), "rb") as f:
+            vectorizer = pickle.load(f)
+        with open(os.path.join(path, "shape.json"), encoding="utf-8") as f:
+            shape = tuple(json.load(f))
+        arrays = [np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in ("data", "indices", "indptr")]
+        matrix = csr_matrix(tuple(arrays), shape=shape, copy=False)
+        shard = _attached[path] = (vectorizer, matrix, np.load(os.path.join(path, "ids.npy"), mmap_mode="r"))
+    return shard
+
+
+def _search_batch(paths, queries, k, min_score):
+    """Puntúa todas las consultas del lote con un producto disperso por fragmento"""
+    for stale in set(_attached) - set(paths):
+        del _attached[stale]
+
+    hits = [[] for _ in queries]
+    for path in paths:
+        vectorizer, matrix, ids = _attach(path)
+        # (filas × consultas): solo se materializan las similitudes no nulas
+        scores = (matrix @ vectorizer.transform(queries).T).T.tocsr()
+        for row in range(len(queries)):
+            start, end = scores.indptr[row], scores.indptr[row + 1]
+            data = scores.data[start:end]
+            columns = scores.indices[start:end]
+            top = np.argpartition(-data, k - 1)[:k] if len(data) > k else range(len(data))
+            hits[row].extend((int(ids[columns[i]]), float(data[i])) for i in top if data[i] > min_score)
+    return [heapq.nlargest(k, row_hits, key=lambda hit: hit[1]) for row_hits in hits]
+
+
+class RetrievalPool:
+    """Puntúa las consultas de `ShardedKnowledgeIndex` en varios procesos.
+
+    Los fragmentos se exportan a disco una vez y cada proceso los abre con
+    mmap, sin copia propia de la matriz. Las consultas que llegan casi a la
+    vez (desde varios hilos) se agrupan en un lote y se puntúan con un único
+    producto matriz-matriz. Los fragmentos modificados desde la última
+    exportación (altas nuevas) se puntúan en el proceso principal mientras se
+    reexportan en segundo plano.
+    """
+
+    def __init__(self, index, workers=PROCESOS_RECUPERACION, window=VENTANA_LOTE, max_batch=MAX_LOTE, path=None):
+        self.index = index
+        self.window = window
+        self.max_batch = max_batch
+        self.path = path or tempfile.mkdtemp(prefix="knowledge_mmap_")
+        self._executor = ProcessPoolExecutor(max_workers=workers)
+        self._exported = {}  # id(shard) -> (matrix exportada, ruta)
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._sync_thread = None
+        self._queue = queue.Queue()
+        self._closed = False
+        self.batches = 0
+        self.queries = 0
+        self.sync()
+        self._dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self._dispatcher.start()
+
+    # -----------------------------
+    # EXPORTACIÓN DE FRAGMENTOS
+    # -----------------------------
+    def _split(self):
+        """(rutas exportadas al día, fragmentos a puntuar en local)"""
+        paths, local = [], []
+        with self._lock:
+            if self._closed:
+                return paths, self.index.loaded_shards()
+            for shard in self.index.loaded_shards():
+                exported = self._exported.get(id(shard))
+                if exported is not None and exported[0] is shard.index.matrix:
+                    paths.append(exported[1])
+                else:
+                    local.append(shard)
+        return paths, local
+
+    def sync(self):
+        """Exporta los fragmentos nuevos o modificados"""
+        _, stale = self._split()
+        with self._lock:
+            current = {id(shard) for shard in self.index.shards}
+            for key in set(self._exported) - current:
+                del self._exported[key]
+        for shard in stale:
+            matrix = shard.index.matrix
+            if matrix is None:
+                continue
+            with self._lock:
+                self._generation += 1
+                path = os.path.join(self.path, f"shard_{self._generation:06d}")
+            export_shard(shard.index, path)
+            with self._lock:
+                previous = self._exported.get(id(shard))
+                self._exported[id(shard)] = (matrix, path)
+            if previous:
+                # Los procesos sueltan la ruta antigua en su siguiente lote
+                threading.Timer(60, shutil.rmtree, (previous[1], True)).start()
+
+    def _sync_in_background(self):
+        with self._lock:
+            if self._sync_thread and self._sync_thread.is_alive():
+                return
+            self._sync_thread = threading.Thread(target=self.sync, daemon=True)
+            self._sync_thread.start()
+
+    # -----------------------------
+    # LOTES
+    # -----------------------------
+    def search(self, user_input, k=1, min_score=0.0):
+        """[(id, score)] de las k preguntas más similares (bloquea hasta tener el lote)"""
+        paths, local = self._split()
+        hits = []
+        if paths:
+            future = Future()
+            self._queue.put((user_input, k, min_score, paths, future))
+            hits = future.result()
+        if local:
+            for shard in local:
+                hits.extend(shard.index.search(user_input, k, min_score))
+            self._sync_in_background()
+        return heapq.nlargest(k, hits, key=lambda hit: hit[1])
+
+    def _dispatch(self):
+        while not self._closed:
+            try:
+                first = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            batch = [first]
+            try:
+                while len(batch) < self.max_batch:
+                    batch.append(self._queue.get(timeout=self.window))
+            except queue.Empty:
+                pass
+
+            # Se agrupan las consultas con los mismos parámetros y fragmentos
+            groups = {}
+            for item in batch:
+                groups.setdefault((item[1], item[2], tuple(item[3])), []).append(item)
+            for (k, min_score, paths), items in groups.items():
+                self.batches += 1
+                self.queries += len(items)
+                try:
+                    task = self._executor.submit(_search_batch, list(paths), [item[0] for item in items], k, min_score)
+                except RuntimeError as e:
+                    for item in items:
+                        item[4].set_exception(e)
+                    continue
+                task.add_done_callback(lambda task, items=items: self._deliver(task, items))
+
+    @staticmethod
+    def _deliver(task, items):
+        try:
+            results = task.result()
+        except Exception as e:
+            for item in items:
+                item[4].set_exception(e)
+            return
+        for item, result in zip(items, results):
+            item[4].set_result(result)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "queries": self.queries,
+            "avg_batch": self.queries / self.batches if self.batches else 0.0,
+        }
+
+    def close(self):
+        self._closed = True
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            item[4].set_exception(RuntimeError("RetrievalPool cerrado"))
+        shutil.rmtree(self.path, ignore_errors=True)
@@ -0,0 +1,198 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+
+from interaction_log import SegmentWriter, iter_segments
+from text_normalization import analyze, normalize_text
+
+# -----------------------------
+# TOP-K, RE-RANKING Y CALIBRACIÓN DEL UMBRAL
+# -----------------------------
+K_CANDIDATOS = 5
+MARGEN_EMPATE = 0.05      # Diferencia mínima con el segundo candidato (si su respuesta es otra)
+PRECISION_OBJETIVO = 0.95
+MIN_MUESTRAS = 30         # Por debajo no se recalibra
+PESOS_RERANKER = {"score": 0.6, "cobertura": 0.3, "jaccard": 0.1}
+
+
+class Candidate:
+    def __init__(self, question, answer, score):
+        self.question = question
+        self.answer = answer
+        self.score = score        # similitud TF-IDF: la que se compara con el umbral
+        self.confidence = score   # orden tras el re-ranking
+
+
+def rerank(user_input, candidates, weights=PESOS_RERANKER):
+    """Reordena los k candidatos con rasgos baratos sobre los tokens normalizados:
+    cobertura de la consulta y solapamiento (Jaccard) además del score TF-IDF"""
+    query = set(analyze(user_input))
+    for candidate in candidates:
+        tokens = set(analyze(candidate.question))
+        common = len(query & tokens)
+        coverage = common / len(query) if query else 0.0
+        jaccard = common / len(query | tokens) if query or tokens else 0.0
+        candidate.confidence = (
+            weights["score"] * candidate.score + weights["cobertura"] * coverage + weights["jaccard"] * jaccard
+        )
+    return sorted(candidates, key=lambda candidate: candidate.confidence, reverse=True)
+
+
+def decide(candidates, threshold, margin=MARGEN_EMPATE):
+    """(candidato elegido o None, margen con el segundo).
+
+    El re-ranking decide el orden; el umbral se aplica a la similitud TF-IDF
+    del elegido, la escala en la que está ajustado UMBRAL_SIMILITUD y en la
+    que se calibra. Un casi-empate entre respuestas distintas se rechaza: es
+    mejor que Ollama responda con esos candidatos como contexto que devolver
+    la equivocada.
+    """
+    if not candidates:
+        return None, 0.0
+    best = candidates[0]
+    gap = best.confidence - candidates[1].confidence if len(candidates) > 1 else best.confidence
+    if best.score <= threshold:
+        return None, gap
+    if len(candidates) > 1 and gap < margin and candidates[1].answer != best.answer:
+        return None, gap
+    return best, gap
+
+
+# -----------------------------
+# REGISTRO DE DECISIONES Y RESULTADOS
+# -----------------------------
+def answer_digest(answer):
+    return hashlib.blake2b(normalize_text(answer).encode("utf-8"), digest_size=8).hexdigest()
+
+
+class RetrievalLog:
+    """Decisiones de recuperación y respuestas enseñadas, en segmentos JSONL
+    escritos en segundo plano (no añade latencia a `get_db_response`).
+
+    Cada decisión guarda la huella de la respuesta del mejor candidato, se
+    aceptara o no. Al calibrar, si el usuario enseñó después una respuesta
+    para esa pregunta, el candidato era correcto solo si coincide con ella;
+    sin respuesta enseñada, las aceptadas cuentan como correctas y las
+    rechazadas se ignoran (no se sabe si el candidato servía).
+    """
+
+    def __init__(self, directory, **kwargs):
+        self.writer = SegmentWriter(directory, "retrieval", **kwargs)
+
+    def record(self, user_input, candidates, accepted, gap):
+        best = candidates[0] if candidates else None
+        self.writer.write({
+            "type": "decision",
+            "ts": time.time(),
+            "key": normalize_text(user_input),
+            "score": best.score if best else 0.0,
+            "confidence": best.confidence if best else 0.0,
+            "gap": gap,
+            "accepted": accepted is not None,
+            "k": len(candidates),
+            "answer": answer_digest(best.answer) if best else None,
+        })
+
+    def outcome(self, user_input, answer):
+        """El usuario enseñó `answer` para esta pregunta"""
+        self.writer.write({
+            "type": "outcome",
+            "ts": time.time(),
+            "key": normalize_text(user_input),
+            "answer": answer_digest(answer),
+        })
+
+    def close(self):
+        self.writer.close()
+
+
+def samples_from_log(directory):
+    """[(score, correcta)] de las decisiones con resultado conocido"""
+    decisions, taught = {}, {}
+    for entry in iter_segments(directory, "retrieval"):
+        if entry["type"] == "decision" and entry["answer"] is not None:
+            decisions[entry["key"]] = entry
+        elif entry["type"] == "outcome":
+            taught[entry["key"]] = entry["answer"]
+    samples = []
+    for key, decision in decisions.items():
+        if key in taught:
+            samples.append((decision["score"], taught[key] == decision["answer"]))
+        elif decision["accepted"]:
+            samples.append((decision["score"], True))
+    return samples
+
+
+def samples_from_labeled(index, labeled_queries, k=K_CANDIDATOS):
+    """[(score, correcta)] ejecutando consultas etiquetadas (consulta, pregunta correcta)"""
+    samples = []
+    for user_input, expected in labeled_queries:
+        candidates = rerank(user_input, [Candidate(*hit) for hit in index.top_k(user_input, k)])
+        if candidates:
+            samples.append((candidates[0].score, candidates[0].question == expected))
+    return samples
+
+
+def calibrate(samples, target_precision=PRECISION_OBJETIVO):
+    """Umbral más bajo cuya precisión (entre las muestras por encima) alcanza el objetivo"""
+    if len(samples) < MIN_MUESTRAS:
+        return None
+    ordered = sorted(samples, reverse=True)
+    best = None
+    correct = 0
+    for accepted, (score, is_correct) in enumerate(ordered, 1):
+        correct += int(is_correct)
+        if correct / accepted >= target_precision:
+            best = {
+                "threshold": max(0.0, score - 1e-6),
+                "precision": correct / accepted,
+                "coverage": accepted / len(ordered),
+                "samples": len(ordered),
+            }
+    return best
+
+
+def load_calibration(path, default):
+    """Umbral calibrado para este despliegue, o `default` si no hay archivo"""
+    if not path or not os.path.exists(path):
+        return default
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)["threshold"]
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Error al leer umbral calibrado: {e}")
+        return default
+
+
+def main():
+    from chatbot_core import RUTA_LOG_RECUPERACION, RUTA_UMBRAL, load_knowledge_index
+
+    parser = argparse.ArgumentParser(description="Calibra el umbral de la base de conocimiento")
+    parser.add_argument("--log", default=RUTA_LOG_RECUPERACION, help="Registro de decisiones y correcciones")
+    parser.add_argument("--labeled", metavar="JSONL", help='Consultas etiquetadas: {"query": ..., "question": ...}')
+    parser.add_argument("--target", type=float, default=PRECISION_OBJETIVO, help="Precisión mínima deseada")
+    parser.add_argument("--save", action="store_true", help=f"Guarda el umbral en {os.path.basename(RUTA_UMBRAL)}")
+    args = parser.parse_args()
+
+    samples = []
+    if args.labeled:
+        with open(args.labeled, encoding="utf-8") as f:
+            items = [json.loads(line) for line in f if line.strip()]
+        samples += samples_from_labeled(load_knowledge_index(), [(item["query"], item["question"]) for item in items])
+    if args.log and os.path.exists(args.log):
+        samples += samples_from_log(args.log)
+
+    result = calibrate(samples, args.target)
+    if result is None:
+        print(f"Muestras insuficientes ({len(samples)}) o precisión objetivo inalcanzable")
+        return
+    print(json.dumps(result, indent=2))
+    if args.save:
+        with open(RUTA_UMBRAL, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+import argparse
+import json
+import re
+import unicodedata
+from functools import lru_cache, partial
+
+from scipy.sparse import hstack
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.preprocessing import normalize as l2_normalize
+
+# -----------------------------
+# NORMALIZACIÓN DE TEXTO COMPARTIDA
+# -----------------------------
+# Una sola tubería para claves de caché, respuestas instantáneas e índice:
+# minúsculas y sin acentos (claves exactas: cachés, deduplicación, reglas)
+# -> sin palabras vacías -> raíces -> n-gramas de caracteres (solo el índice)
+MEMO_MAX = 50_000            # Entradas distintas memorizadas por cada etapa
+NGRAMAS_CARACTERES = (3, 5)  # Rango de n-gramas (dentro de cada palabra) del índice
+PESO_NGRAMAS = 0.5           # Peso de los n-gramas frente a las raíces (0 = desactivados;
+                             # abaratan la consulta en tablas muy grandes)
+RAIZ_MIN = 4                 # Longitud mínima que deja el recorte de sufijos
+
+# Sin negaciones ("no", "sin", "ni") ni interrogativos ("como", "cuando", "donde"...):
+# cambian el sentido de la pregunta
+PALABRAS_VACIAS = frozenset("""
+a al algo algun alguna algunas alguno algunos ante antes con contra de del desde
+durante e el ella ellas ellos en entre era eres es esa esas ese eso esos esta estas
+este esto estos fue fueron ha han hay la las le les lo los me mi mis mucho muy nos o
+os para pero por que se ser si sobre soy su sus tambien te tiene tu tus un una uno
+unos unas y ya yo
+""".split())
+
+_PUNTUACION = re.compile(r"[^\w\s]")
+_ESPACIOS = re.compile(r"\s+")
+
+# Sufijos del recortador ligero, del más largo al más corto
+_SUFIJOS = sorted("""
+aciones acion amientos amiento imientos imiento adoras adores adora ador anzas anza
+mente idades idad ibles ables ible able encias encia ancias ancia istas ista ismos ismo
+osas osos osa oso ivas ivos iva ivo entes ente antes ante
+iendo ando ieron aron aban aba ar er ir en an
+""".split(), key=len, reverse=True)
+
+try:
+    from nltk.stem.snowball import SpanishStemmer
+    _snowball = SpanishStemmer()
+except ImportError:
+    _snowball = None
+
+
+@lru_cache(maxsize=MEMO_MAX)
+def normalize_text(text):
+    """Minúsculas, sin acentos ni puntuación y con espacios colapsados"""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = _PUNTUACION.sub(" ", text)
+    return _ESPACIOS.sub(" ", text).strip()
+
+
+def light_stem(word):
+    """Recorte de sufijos para cuando NLTK no está instalado"""
+    if len(word) <= RAIZ_MIN:
+        return word
+    if word.endswith("es") and len(word) - 2 >= RAIZ_MIN:
+        word = word[:-2]
+    elif word.endswith("s"):
+        word = word[:-1]
+    for suffix in _SUFIJOS:
+        if word.endswith(suffix) and len(word) - len(suffix) >= RAIZ_MIN:
+            return word[:-len(suffix)]
+    if word[-1] in "aeo" and len(word) - 1 >= RAIZ_MIN:
+        return word[:-1]
+    return word
+
+
+@lru_cache(maxsize=MEMO_MAX)
+def stem(word):
+    return _snowball.stem(word) if _snowball is not None else light_stem(word)
+
+
+@lru_cache(maxsize=MEMO_MAX)
+def analyze(text, stop_words=PALABRAS_VACIAS, stemming=True):
+    """Tokens normalizados, sin palabras vacías y reducidos a su raíz"""
+    tokens = [w for w in normalize_text(text).split() if w not in stop_words]
+    return tuple(stem(w) for w in tokens) if stemming else tuple(tokens)
+
+
+def memo_stats():
+    """Aciertos de memorización de cada etapa"""
+    return {
+        name: fn.cache_info()._asdict()
+        for name, fn in (("normalize_text", normalize_text), ("stem", stem), ("analyze", analyze))
+    }
+
+
+class TextVectorizer:
+    """TF-IDF sobre raíces más TF-IDF sobre n-gramas de caracteres.
+
+    Las raíces unen variantes ("inteligencia"/"inteligente") y los n-gramas
+    toleran erratas y palabras compuestas. Cada bloque se normaliza (L2), se
+    pondera y el resultado se vuelve a normalizar, así el producto escalar
+    sigue siendo la similitud coseno.
+    """
+
+    def __init__(self, stop_words=PALABRAS_VACIAS, stemming=True,
+                 char_ngrams=NGRAMAS_CARACTERES, char_weight=PESO_NGRAMAS):
+        self.stop_words = stop_words
+        self.stemming = stemming
+        self.char_ngrams = char_ngrams
+        self.char_weight = char_weight
+        self.words = TfidfVectorizer(
+            analyzer=partial(analyze, stop_words=stop_words, stemming=stemming),
+            sublinear_tf=True,
+        )
+        self.chars = None
+        if char_ngrams and char_weight:
+            self.chars = TfidfVectorizer(
+                analyzer="char_wb", preprocessor=normalize_text, ngram_range=char_ngrams, sublinear_tf=True,
+            )
+
+    @property
+    def vocabulary_(self):
+        return self.words.vocabulary_
+
+    def build_analyzer(self):
+        return self.words.build_analyzer()
+
+    def _combine(self, word_matrix, char_matrix):
+        if char_matrix is None:
+            return word_matrix
+        return l2_normalize(hstack([word_matrix, self.char_weight * char_matrix], format="csr"))
+
+    def fit_transform(self, texts):
+        texts = list(texts)
+        try:
+            word_matrix = self.words.fit_transform(texts)
+        except ValueError:
+            # Todas las preguntas son palabras vacías: índice sin raíces
+            self.words = TfidfVectorizer(analyzer=partial(analyze, stop_words=frozenset(), stemming=self.stemming))
+            word_matrix = self.words.fit_transform(texts)
+        char_matrix = self.chars.fit_transform(texts) if self.chars is not None else None
+        return self._combine(word_matrix, char_matrix)
+
+    def transform(self, texts):
+        texts = list(texts)
+        char_matrix = self.chars.transform(texts) if self.chars is not None else None
+        return self._combine(self.words.transform(texts), char_matrix)
+
+
+# -----------------------------
+# EVALUACIÓN SOBRE CONSULTAS ETIQUETADAS
+# -----------------------------
+def hit_rate(vectorizer, rows, labeled_queries, threshold):
+    """Fracción de consultas cuya mejor fila es la correcta y supera el umbral"""
+    matrix = vectorizer.fit_transform([question for question, _ in rows])
+    queries = vectorizer.transform([query for query, _ in labeled_queries])
+    similarity = (queries @ matrix.T).toarray()
+    best = similarity.argmax(axis=1)
+    hits = sum(
+        1 for i, (_, expected) in enumerate(labeled_queries)
+        if best[i] == expected and similarity[i, best[i]] > threshold
+    )
+    return hits / len(labeled_queries) if labeled_queries else 0.0
+
+
+def evaluate(rows, labeled_queries, threshold):
+    """Compara el TF-IDF por defecto con la tubería compartida.
+
+    `labeled_queries` es una lista de (consulta, posición de la pregunta correcta).
+    """
+    report = {
+        "tfidf_por_defecto": hit_rate(TfidfVectorizer(), rows, labeled_queries, threshold),
+        "solo_acentos_y_vacias": hit_rate(TextVectorizer(stemming=False, char_weight=0), rows, labeled_queries, threshold),
+        "sin_ngramas": hit_rate(TextVectorizer(char_weight=0), rows, labeled_queries, threshold),
+        "tuberia_completa": hit_rate(TextVectorizer(), rows, labeled_queries, threshold),
+    }
+    report["mejora"] = report["tuberia_completa"] - report["tfidf_por_defecto"]
+    report["stemmer"] = "nltk" if _snowball is not None else "ligero"
+    return report
+
+
+def main():
+    from chatbot_core import get_all_data
+    from knowledge_index import UMBRAL_SIMILITUD
+
+    parser = argparse.ArgumentParser(description="Mide la tasa de aciertos de la normalización de texto")
+    parser.add_argument("eval", metavar="JSONL", help='Consultas etiquetadas: {"query": ..., "question": ...}')
+    parser.add_argument("--threshold", type=float, default=UMBRAL_SIMILITUD)
+    args = parser.parse_args()
+
+    rows = get_all_data()
+    positions = {question: i for i, (question, _) in enumerate(rows)}
+    with open(args.eval, encoding="utf-8") as f:
+        items = [json.loads(line) for line in f if line.strip()]
+    labeled = [(item["query"], positions[item["question"]]) for item in items if item["question"] in positions]
+    print(json.dumps(evaluate(rows, labeled, args.threshold), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
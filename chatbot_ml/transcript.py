@@ -0,0 +1,44 @@
+import json
+import os
+
+# -----------------------------
+# TRANSCRIPCIÓN EN DISCO DE LA CONVERSACIÓN
+# -----------------------------
+
+
+class TranscriptStore:
+    """Mensajes recortados de la ventana de chat, uno por línea en JSON.
+
+    Cada mensaje es una lista de segmentos [texto, tag]. Se guarda el
+    desplazamiento de cada línea, así una página se lee con un solo `seek`
+    sin recorrer el archivo.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._offsets = []
+        self._file = open(path, "w+b")
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def append(self, segments):
+        self._file.seek(0, os.SEEK_END)
+        self._offsets.append(self._file.tell())
+        self._file.write((json.dumps(segments, ensure_ascii=False) + "\n").encode("utf-8"))
+
+    def read(self, start, end):
+        """Mensajes [start, end) en orden"""
+        if start >= end:
+            return []
+        self._file.flush()
+        self._file.seek(self._offsets[start])
+        return [json.loads(self._file.readline()) for _ in range(start, end)]
+
+    def clear(self):
+        self._file.seek(0)
+        self._file.truncate()
+        self._offsets = []
+
+    def close(self):
+        self._file.close()